@@ -2,6 +2,8 @@ from django.contrib import admin
 
 from .models import (
     Facility,
+    FacilityTicketCounter,
+    HistoryRecord,
     IncidentTicket,
     IncidentType,
     Location,
@@ -11,14 +13,33 @@ from .models import (
     Shift,
     TimeEntry,
     TimeOffRequest,
+    UserTicketCounter,
+    WeeklyDepartmentHours,
+    WeeklyFacilityHours,
+    WeeklyUserHours,
 )
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base for admins over tables that grow without bound
+
+    Skips the unfiltered COUNT(*) shown next to filtered results and
+    estimates the changelist total for unfiltered views.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "job_title", "department", "is_active")
     list_filter = ("is_active", "department")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email", "job_title", "department")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Location)
@@ -32,7 +53,9 @@ class LocationAdmin(admin.ModelAdmin):
 class FacilityAdmin(admin.ModelAdmin):
     list_display = ("name", "location", "facility_type", "capacity", "is_active")
     list_filter = ("is_active", "facility_type", "location")
+    list_select_related = ("location",)
     search_fields = ("name", "facility_type")
+    autocomplete_fields = ("location",)
 
 
 @admin.register(Shift)
@@ -50,7 +73,7 @@ class IncidentTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(IncidentTicket)
-class IncidentTicketAdmin(admin.ModelAdmin):
+class IncidentTicketAdmin(LargeTableAdmin):
     list_display = (
         "title",
         "created_by",
@@ -60,17 +83,19 @@ class IncidentTicketAdmin(admin.ModelAdmin):
         "updated_at",
     )
     list_filter = ("status", "incident_type", "facility")
+    list_select_related = ("created_by", "assigned_to")
     search_fields = (
         "title",
         "description",
         "created_by__username",
         "assigned_to__username",
     )
+    autocomplete_fields = ("created_by", "assigned_to", "incident_type", "facility")
     date_hierarchy = "created_at"
 
 
 @admin.register(ServiceTicket)
-class ServiceTicketAdmin(admin.ModelAdmin):
+class ServiceTicketAdmin(LargeTableAdmin):
     list_display = (
         "title",
         "created_by",
@@ -80,25 +105,29 @@ class ServiceTicketAdmin(admin.ModelAdmin):
         "updated_at",
     )
     list_filter = ("status", "facility")
+    list_select_related = ("created_by", "assigned_to")
     search_fields = (
         "title",
         "description",
         "created_by__username",
         "assigned_to__username",
     )
+    autocomplete_fields = ("created_by", "assigned_to", "facility")
     date_hierarchy = "created_at"
 
 
 @admin.register(TimeEntry)
-class TimeEntryAdmin(admin.ModelAdmin):
+class TimeEntryAdmin(LargeTableAdmin):
     list_display = ("user", "entry_type", "timestamp", "location")
     list_filter = ("entry_type", "location")
+    list_select_related = ("user", "location")
     search_fields = ("user__username", "note")
+    autocomplete_fields = ("user", "location")
     date_hierarchy = "timestamp"
 
 
 @admin.register(ScheduledEvent)
-class ScheduledEventAdmin(admin.ModelAdmin):
+class ScheduledEventAdmin(LargeTableAdmin):
     list_display = (
         "title",
         "event_type",
@@ -108,13 +137,14 @@ class ScheduledEventAdmin(admin.ModelAdmin):
         "is_recurring",
     )
     list_filter = ("event_type", "facility", "is_recurring")
+    list_select_related = ("facility",)
     search_fields = ("title", "notes")
+    autocomplete_fields = ("users", "facility")
     date_hierarchy = "start_time"
-    filter_horizontal = ("users",)
 
 
 @admin.register(TimeOffRequest)
-class TimeOffRequestAdmin(admin.ModelAdmin):
+class TimeOffRequestAdmin(LargeTableAdmin):
     list_display = (
         "user",
         "request_type",
@@ -124,5 +154,66 @@ class TimeOffRequestAdmin(admin.ModelAdmin):
         "created_at",
     )
     list_filter = ("request_type", "status")
+    list_select_related = ("user",)
     search_fields = ("user__username", "reason")
+    autocomplete_fields = ("user", "reviewed_by")
     date_hierarchy = "start_date"
+
+
+@admin.register(FacilityTicketCounter)
+class FacilityTicketCounterAdmin(admin.ModelAdmin):
+    list_display = ("facility", "open_incidents", "open_services", "updated_at")
+    list_select_related = ("facility",)
+    readonly_fields = ("facility", "open_incidents", "open_services", "updated_at")
+
+
+@admin.register(UserTicketCounter)
+class UserTicketCounterAdmin(admin.ModelAdmin):
+    list_display = ("user", "assigned_incidents", "assigned_services", "updated_at")
+    list_select_related = ("user",)
+    readonly_fields = ("user", "assigned_incidents", "assigned_services", "updated_at")
+
+
+@admin.register(HistoryRecord)
+class HistoryRecordAdmin(LargeTableAdmin):
+    list_display = ("model", "object_id", "action", "changed_by", "changed_at")
+    list_filter = ("model", "action")
+    search_fields = ("=object_id",)
+    list_select_related = ("changed_by",)
+    readonly_fields = (
+        "model",
+        "object_id",
+        "action",
+        "changes",
+        "changed_by",
+        "changed_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WeeklyUserHours)
+class WeeklyUserHoursAdmin(admin.ModelAdmin):
+    list_display = ("week", "user", "department", "hours")
+    list_filter = ("week", "department")
+    list_select_related = ("user",)
+    readonly_fields = ("week", "user", "department", "hours")
+
+
+@admin.register(WeeklyDepartmentHours)
+class WeeklyDepartmentHoursAdmin(admin.ModelAdmin):
+    list_display = ("week", "department", "hours", "staff")
+    list_filter = ("week",)
+    readonly_fields = ("week", "department", "hours", "staff")
+
+
+@admin.register(WeeklyFacilityHours)
+class WeeklyFacilityHoursAdmin(admin.ModelAdmin):
+    list_display = ("week", "facility", "hours", "staff")
+    list_filter = ("week",)
+    list_select_related = ("facility",)
+    readonly_fields = ("week", "facility", "hours", "staff")
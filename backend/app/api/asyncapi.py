@@ -0,0 +1,89 @@
+"""
+Async function views with the behaviour of DRF's @api_view.
+
+DRF 3.14 only runs sync views. async_api_view wraps an ``async def`` view
+so that DRF's authentication, permission and throttle checks, which touch
+the database, the session and Redis, run in a worker thread, while the view
+itself runs on the event loop. Under ASGI a view awaiting slow I/O then
+does not hold a thread; under WSGI Django runs the view to completion in
+the request's thread as for any other async view.
+
+The usual decorators apply, listed below the view decorator:
+
+    @async_api_view(["POST"])
+    @permission_classes([permissions.IsAuthenticated])
+    async def send_email_view(request):
+        ...
+
+ORM access and other blocking calls inside the view go through
+sync_to_async. Django gives each ASGI request a thread of its own for these,
+so a slow call only holds up the request that made it.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):  # OPTIONS is answered by APIView
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(http_method_names):
+    """@api_view for ``async def`` views"""
+
+    def decorator(func):
+        assert asyncio.iscoroutinefunction(func), "async_api_view needs an async def view"
+
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        attrs = {
+            "__doc__": func.__doc__,
+            "http_method_names": [
+                method.lower() for method in set(http_method_names) | {"options"}
+            ],
+        }
+        attrs.update((method.lower(), handler) for method in http_method_names)
+        for name in (
+            "renderer_classes",
+            "parser_classes",
+            "authentication_classes",
+            "throttle_classes",
+            "permission_classes",
+            "schema",
+        ):
+            attrs[name] = getattr(func, name, getattr(APIView, name))
+
+        view_class = type(func.__name__, (AsyncAPIView,), attrs)
+        view_class.__module__ = func.__module__
+        return view_class.as_view()
+
+    return decorator
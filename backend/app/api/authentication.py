@@ -0,0 +1,80 @@
+"""
+Authentication backend that caches users between requests.
+
+With the cached_db session engine the session of a request is read from the
+cache; this backend does the same for ``request.user``, which Django would
+otherwise load with a query on every authenticated request. Together they
+let a request reach its view without touching the database.
+
+The cached user comes with its profile and its permission sets, so
+``user.profile`` and ``user.has_perm()`` cost no queries either. Each entry
+is stored with the user's current version, and both are fetched in one
+cache round trip. Saving the user or its profile, or changing its groups
+or permissions, bumps the version once the change commits (see
+api/signals.py), and the next request reloads the user from the database.
+Entries also expire after USER_CACHE_TIMEOUT seconds.
+
+Only loading the user of a session goes through the cache; checking a
+password does not. Django's ModelBackend stays listed after this backend so
+that sessions created before it keep working.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+
+def _user_key(pk):
+    return f"auth:user:{pk}"
+
+
+def _version_key(pk):
+    return f"auth:user-version:{pk}"
+
+
+def bump_user_versions(user_ids):
+    """Invalidate the cached copies of the given users"""
+    cache.delete_many([_version_key(pk) for pk in set(user_ids)])
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and username is not None and password is not None:
+            # Stop here, or ModelBackend would hash the password a second time
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        cached = cache.get_many([_version_key(user_id), _user_key(user_id)])
+        version = cached.get(_version_key(user_id))
+        entry = cached.get(_user_key(user_id))
+        if version is not None and entry is not None and entry[0] == version:
+            user = entry[1]
+        else:
+            user = self.load_user(user_id, version)
+        if user is None or not self.user_can_authenticate(user):
+            return None
+        return user
+
+    def load_user(self, pk, version):
+        """
+        Load a user from the database and cache it
+
+        The version is settled before the query: a change committed after
+        it bumps the version, so the copy cached here is never served.
+        """
+        if version is None:
+            cache.add(_version_key(pk), uuid.uuid4().hex, None)
+            version = cache.get(_version_key(pk))
+
+        user = User._default_manager.select_related("profile").filter(pk=pk).first()
+        if user is not None:
+            self.get_all_permissions(user)  # fills the permission caches
+        if version is not None:
+            cache.set(_user_key(pk), (version, user), settings.USER_CACHE_TIMEOUT)
+        return user
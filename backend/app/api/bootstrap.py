@@ -0,0 +1,177 @@
+"""
+Sections of the dashboard bootstrap payload.
+
+Each section builds the data one of the frontend's startup list calls used
+to fetch, with its joins resolved up front. Reference sections change rarely
+and are cached until one of their models is written (see api.signals).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import (
+    Facility,
+    FacilityTicketCounter,
+    IncidentTicket,
+    IncidentType,
+    Location,
+    Profile,
+    ScheduledEvent,
+    Shift,
+    TimeOffRequest,
+    UserTicketCounter,
+)
+from .serializers import (
+    FacilitySerializer,
+    IncidentTicketSerializer,
+    IncidentTypeSerializer,
+    LocationSerializer,
+    ProfileSerializer,
+    ScheduledEventSerializer,
+    ShiftSerializer,
+    TimeOffRequestSerializer,
+    UserSerializer,
+)
+
+REFERENCE_CACHE_PREFIX = "bootstrap:reference:"
+
+
+def _locations(request):
+    return LocationSerializer(Location.objects.all(), many=True).data
+
+
+def _facilities(request):
+    queryset = Facility.objects.select_related("location")
+    return FacilitySerializer(queryset, many=True).data
+
+
+def _shifts(request):
+    return ShiftSerializer(Shift.objects.all(), many=True).data
+
+
+def _incident_types(request):
+    return IncidentTypeSerializer(IncidentType.objects.all(), many=True).data
+
+
+# Section name -> (builder, models whose writes invalidate the cached section)
+REFERENCE_SECTIONS = {
+    "locations": (_locations, (Location,)),
+    "facilities": (_facilities, (Facility, Location)),
+    "shifts": (_shifts, (Shift,)),
+    "incident_types": (_incident_types, (IncidentType,)),
+}
+
+
+def reference_section(name, request):
+    """Return a reference section from the cache, building it on a miss"""
+    builder, _ = REFERENCE_SECTIONS[name]
+    key = REFERENCE_CACHE_PREFIX + name
+    data = cache.get(key)
+    if data is None:
+        data = builder(request)
+        cache.set(key, data, settings.BOOTSTRAP_REFERENCE_TIMEOUT)
+    return data
+
+
+def invalidate_reference_sections(model):
+    """
+    Drop every cached reference section built from the given model
+
+    Called on commit by the post_save and post_delete receivers in
+    api.signals, and by ReferenceQuerySet for bulk_create() and update(),
+    which send no signals. Raw SQL writes are only picked up when the
+    cached section expires after BOOTSTRAP_REFERENCE_TIMEOUT.
+    """
+    cache.delete_many(
+        [
+            REFERENCE_CACHE_PREFIX + name
+            for name, (_, models) in REFERENCE_SECTIONS.items()
+            if model in models
+        ]
+    )
+
+
+def _user(request):
+    return UserSerializer(request.user).data
+
+
+def _profiles(request):
+    queryset = Profile.objects.filter(is_active=True).select_related("user")
+    return ProfileSerializer(queryset, many=True).data
+
+
+def _incident_tickets(request):
+    queryset = (
+        IncidentTicket.objects.filter(status__in=IncidentTicket.OPEN_STATUSES)
+        .select_related(
+            "created_by", "assigned_to", "incident_type", "facility__location"
+        )
+        .order_by("-created_at")[: settings.BOOTSTRAP_TICKET_LIMIT]
+    )
+    return IncidentTicketSerializer(queryset, many=True).data
+
+
+def _scheduled_events(request):
+    now = timezone.now()
+    queryset = (
+        ScheduledEvent.objects.filter(
+            users=request.user,
+            end_time__gte=now,
+            start_time__lte=now + timedelta(days=settings.BOOTSTRAP_SCHEDULE_DAYS),
+        )
+        .select_related("facility__location")
+        .prefetch_related(Prefetch("users", queryset=User.objects.order_by("pk")))
+        .order_by("start_time")
+    )
+    return ScheduledEventSerializer(queryset, many=True).data
+
+
+def _time_off_requests(request):
+    queryset = (
+        TimeOffRequest.objects.filter(user=request.user)
+        .select_related("user", "reviewed_by")
+        .order_by("-start_date")
+    )
+    return TimeOffRequestSerializer(queryset, many=True).data
+
+
+def _counters(request):
+    return {
+        "facilities": list(
+            FacilityTicketCounter.objects.order_by("facility_id").values(
+                "facility_id", "open_incidents", "open_services"
+            )
+        ),
+        "user": UserTicketCounter.objects.filter(user=request.user)
+        .values("assigned_incidents", "assigned_services")
+        .first()
+        or {"assigned_incidents": 0, "assigned_services": 0},
+    }
+
+
+USER_SECTIONS = {
+    "user": _user,
+    "profiles": _profiles,
+    "incident_tickets": _incident_tickets,
+    "scheduled_events": _scheduled_events,
+    "time_off_requests": _time_off_requests,
+    "counters": _counters,
+}
+
+SECTIONS = [*USER_SECTIONS, *REFERENCE_SECTIONS]
+
+
+def build_bootstrap(request, sections=None):
+    """Build the requested sections (all by default) keyed by section name"""
+    payload = {}
+    for name in sections or SECTIONS:
+        if name in REFERENCE_SECTIONS:
+            payload[name] = reference_section(name, request)
+        else:
+            payload[name] = USER_SECTIONS[name](request)
+    return payload
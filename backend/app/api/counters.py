@@ -0,0 +1,208 @@
+"""
+Maintenance of the denormalized ticket counters.
+
+FacilityTicketCounter and UserTicketCounter hold the number of open tickets
+per facility and per assignee. Single saves and bulk creates adjust them with
+F() increments inside the writing transaction, bulk updates recompute the
+affected rows from the ticket tables, and the reconcile_ticket_counters
+command repairs any drift.
+"""
+
+from collections import Counter
+
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import (
+    Facility,
+    FacilityTicketCounter,
+    IncidentTicket,
+    ServiceTicket,
+    UserTicketCounter,
+)
+
+# Ticket fields whose changes can move a ticket between counters
+COUNTED_FIELDS = {"status", "facility", "facility_id", "assigned_to", "assigned_to_id"}
+
+FACILITY_FIELDS = {IncidentTicket: "open_incidents", ServiceTicket: "open_services"}
+USER_FIELDS = {IncidentTicket: "assigned_incidents", ServiceTicket: "assigned_services"}
+
+
+def open_ticket_key(model, status, facility_id, assigned_to_id):
+    """Return the (facility_id, assigned_to_id) an open ticket counts towards"""
+    if status not in model.OPEN_STATUSES:
+        return None
+    return facility_id, assigned_to_id
+
+
+def ticket_key(ticket):
+    """Counter key for the in-memory state of a ticket"""
+    return open_ticket_key(
+        type(ticket), ticket.status, ticket.facility_id, ticket.assigned_to_id
+    )
+
+
+def stored_ticket_key(model, state):
+    """Counter key for a ticket's stored state, as read by api.history.stored_state"""
+    if state is None:
+        return None
+    return open_ticket_key(
+        model, state["status"], state["facility"], state["assigned_to"]
+    )
+
+
+def apply_ticket_deltas(model, changes):
+    """
+    Adjust the counters for a list of (previous_key, new_key) ticket changes
+    """
+    facility_deltas = Counter()
+    user_deltas = Counter()
+    for previous, new in changes:
+        for key, sign in ((previous, -1), (new, 1)):
+            if key is None:
+                continue
+            facility_id, user_id = key
+            facility_deltas[facility_id] += sign
+            if user_id is not None:
+                user_deltas[user_id] += sign
+
+    missing_facilities = _increment(
+        FacilityTicketCounter, FACILITY_FIELDS[model], facility_deltas
+    )
+    missing_users = _increment(UserTicketCounter, USER_FIELDS[model], user_deltas)
+    if missing_facilities or missing_users:
+        recompute_counters(missing_facilities, missing_users)
+
+
+def _increment(counter_model, field, deltas):
+    """Apply deltas with F() updates, returning keys that have no counter row yet"""
+    now = timezone.now()
+    missing = set()
+    for pk, delta in deltas.items():
+        if not delta:
+            continue
+        updated = counter_model.objects.filter(pk=pk).update(
+            **{field: F(field) + delta, "updated_at": now}
+        )
+        # Rows are only created on increments; a decrement against a missing
+        # row happens while its facility or user is being deleted.
+        if not updated and delta > 0:
+            missing.add(pk)
+    return missing
+
+
+def affected_keys(queryset):
+    """Return the facility and assignee ids referenced by a ticket queryset"""
+    facility_ids = set()
+    user_ids = set()
+    rows = queryset.order_by().values_list("facility_id", "assigned_to_id").distinct()
+    for facility_id, user_id in rows:
+        facility_ids.add(facility_id)
+        if user_id is not None:
+            user_ids.add(user_id)
+    return facility_ids, user_ids
+
+
+def _count_open(model, group_field, ids):
+    queryset = model._base_manager.filter(
+        status__in=model.OPEN_STATUSES, **{f"{group_field}__isnull": False}
+    )
+    if ids is not None:
+        queryset = queryset.filter(**{f"{group_field}__in": ids})
+    return dict(
+        queryset.order_by().values_list(group_field).annotate(total=Count("pk"))
+    )
+
+
+def expected_facility_counts(facility_ids=None):
+    """Compute {facility_id: (open_incidents, open_services)} from the tickets"""
+    incidents = _count_open(IncidentTicket, "facility_id", facility_ids)
+    services = _count_open(ServiceTicket, "facility_id", facility_ids)
+    if facility_ids is None:
+        facility_ids = Facility.objects.values_list("pk", flat=True)
+    return {pk: (incidents.get(pk, 0), services.get(pk, 0)) for pk in facility_ids}
+
+
+def expected_user_counts(user_ids=None):
+    """Compute {user_id: (assigned_incidents, assigned_services)} from the tickets"""
+    incidents = _count_open(IncidentTicket, "assigned_to_id", user_ids)
+    services = _count_open(ServiceTicket, "assigned_to_id", user_ids)
+    if user_ids is None:
+        user_ids = set(incidents) | set(services)
+        user_ids.update(UserTicketCounter.objects.values_list("pk", flat=True))
+    return {pk: (incidents.get(pk, 0), services.get(pk, 0)) for pk in user_ids}
+
+
+def recompute_counters(facility_ids=None, user_ids=None):
+    """
+    Rewrite counter rows from the ticket tables; None recomputes every row
+    """
+    if facility_ids is None or facility_ids:
+        _store(
+            FacilityTicketCounter,
+            "facility",
+            ("open_incidents", "open_services"),
+            expected_facility_counts(facility_ids),
+        )
+    if user_ids is None or user_ids:
+        _store(
+            UserTicketCounter,
+            "user",
+            ("assigned_incidents", "assigned_services"),
+            expected_user_counts(user_ids),
+        )
+
+
+def _store(counter_model, key_field, fields, expected):
+    if not expected:
+        return
+    now = timezone.now()
+    counter_model.objects.bulk_create(
+        [
+            counter_model(
+                **{
+                    f"{key_field}_id": pk,
+                    fields[0]: first,
+                    fields[1]: second,
+                    "updated_at": now,
+                }
+            )
+            for pk, (first, second) in expected.items()
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=[key_field],
+        update_fields=[*fields, "updated_at"],
+    )
+
+
+def find_drift():
+    """
+    Compare stored counters with the ticket tables
+
+    Returns (facility_drift, user_drift), each a list of
+    (pk, stored, expected) tuples where stored is None for missing rows.
+    """
+    stored_facilities = {
+        pk: (incidents, services)
+        for pk, incidents, services in FacilityTicketCounter.objects.values_list(
+            "facility_id", "open_incidents", "open_services"
+        )
+    }
+    stored_users = {
+        pk: (incidents, services)
+        for pk, incidents, services in UserTicketCounter.objects.values_list(
+            "user_id", "assigned_incidents", "assigned_services"
+        )
+    }
+    facility_drift = [
+        (pk, stored_facilities.get(pk), expected)
+        for pk, expected in expected_facility_counts().items()
+        if stored_facilities.get(pk) != expected
+    ]
+    user_drift = [
+        (pk, stored_users.get(pk), expected)
+        for pk, expected in expected_user_counts().items()
+        if stored_users.get(pk) != expected
+    ]
+    return facility_drift, user_drift
@@ -0,0 +1,299 @@
+"""
+iCalendar feeds of scheduled events per user and per facility.
+
+Feed URLs carry a signed token instead of a session, so calendar apps can
+subscribe to them. The signature mixes in a per-feed secret (CalendarFeedKey)
+that rotate_feed_key() replaces, revoking every URL issued for the feed
+before. Feeds never rotated have no secret and keep their original URLs.
+
+Each feed has a version in the cache that signals reset whenever an event in
+it changes. The ETag and the cached body are keyed by that version and the
+current date (the feed covers a window around today), so polling an
+unchanged feed costs a cache read, and usually just a 304.
+
+Feeds cover CALENDAR_FEED_PAST_DAYS before today to CALENDAR_FEED_FUTURE_DAYS
+after it. Recurring events are expanded into their occurrences within that
+window. ``recurrence_pattern`` is ``daily``, ``weekly`` or ``monthly``; a
+weekly pattern may list days, as in ``weekly:monday,thursday``.
+"""
+
+import uuid
+from calendar import monthrange
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from .models import CalendarFeedKey, ScheduledEvent
+
+FEED_SALT = "api.feeds"
+SCOPES = ("user", "facility")
+WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+
+
+def _key_cache_key(scope, pk):
+    return f"calendar:key:{scope}:{pk}"
+
+
+def feed_keys(scope, pks):
+    """{pk: secret} for the given feeds, "" for feeds never rotated"""
+    cache_keys = {pk: _key_cache_key(scope, pk) for pk in pks}
+    cached = cache.get_many(list(cache_keys.values()))
+    keys = {pk: cached[key] for pk, key in cache_keys.items() if key in cached}
+    missing = [pk for pk in cache_keys if pk not in keys]
+    if missing:
+        stored = dict(
+            CalendarFeedKey.objects.filter(
+                scope=scope, object_id__in=missing
+            ).values_list("object_id", "key")
+        )
+        found = {pk: stored.get(pk, "") for pk in missing}
+        cache.set_many(
+            {cache_keys[pk]: key for pk, key in found.items()},
+            settings.CALENDAR_FEED_CACHE_TIMEOUT,
+        )
+        keys.update(found)
+    return keys
+
+
+def _signer(key):
+    return signing.Signer(salt=f"{FEED_SALT}:{key}" if key else FEED_SALT)
+
+
+def sign_feed(scope, pk, key=None):
+    if key is None:
+        key = feed_keys(scope, [pk])[pk]
+    return _signer(key).sign(f"{scope}-{pk}")
+
+
+def unsign_feed(scope, token):
+    """Return the object id a feed token grants, or raise BadSignature"""
+    value, _, _ = token.rpartition(signing.Signer().sep)
+    token_scope, _, pk = value.partition("-")
+    if token_scope != scope or not pk.isdigit():
+        raise signing.BadSignature(token)
+    pk = int(pk)
+    _signer(feed_keys(scope, [pk])[pk]).unsign(token)
+    return pk
+
+
+def rotate_feed_key(scope, pk):
+    """Give a feed a new secret, revoking its URLs; returns the secret"""
+    key = uuid.uuid4().hex
+    CalendarFeedKey.objects.update_or_create(
+        scope=scope, object_id=pk, defaults={"key": key}
+    )
+    transaction.on_commit(partial(cache.delete, _key_cache_key(scope, pk)))
+    return key
+
+
+def _version_key(scope, pk):
+    return f"calendar:version:{scope}:{pk}"
+
+
+def feed_version(scope, pk):
+    """The feed's current version, starting a new one if none is cached"""
+    key = _version_key(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_feed_versions(user_ids=(), facility_ids=()):
+    """Invalidate the feeds of the given users and facilities"""
+    cache.delete_many(
+        [_version_key("user", pk) for pk in set(user_ids)]
+        + [_version_key("facility", pk) for pk in set(facility_ids)]
+    )
+
+
+def feed_tag(scope, pk):
+    """Identifies the feed's current content; used as ETag and cache key"""
+    return f"{feed_version(scope, pk)}-{timezone.localdate():%Y%m%d}"
+
+
+def feed_cache_key(scope, pk, tag):
+    return f"calendar:feed:{scope}:{pk}:{tag}"
+
+
+def parse_recurrence(pattern):
+    """Return (frequency, weekdays) for a recurrence_pattern, or None"""
+    frequency, _, days = pattern.strip().lower().partition(":")
+    if frequency not in ("daily", "weekly", "monthly"):
+        return None
+    weekdays = set()
+    for name in days.split(","):
+        name = name.strip()[:3]
+        for number, day in enumerate(WEEKDAYS):
+            if name and day.startswith(name):
+                weekdays.add(number)
+    return frequency, sorted(weekdays)
+
+
+def occurrences(event, window_start, window_end):
+    """Yield (start, end) of each occurrence of event within the window"""
+    duration = event.end_time - event.start_time
+    recurrence = event.is_recurring and parse_recurrence(event.recurrence_pattern)
+    if not recurrence:
+        if event.start_time < window_end and event.end_time > window_start:
+            yield event.start_time, event.end_time
+        return
+
+    frequency, weekdays = recurrence
+    # Expand in local time so occurrences keep their wall-clock time over DST
+    first = timezone.localtime(event.start_time)
+    first_day, time_of_day = first.date(), first.time().replace(tzinfo=None)
+    earliest = timezone.localtime(window_start - duration).date()
+    last_day = timezone.localtime(window_end).date()
+
+    if frequency == "monthly":
+        days = _monthly(first_day, earliest, last_day)
+    else:
+        step = 1 if frequency == "daily" else 7
+        offsets = [0]
+        if frequency == "weekly" and weekdays:
+            offsets = [(day - first_day.weekday()) % 7 for day in weekdays]
+        skip = max((earliest - first_day).days // step - 1, 0)
+        days = _stepped(first_day + timedelta(days=skip * step), step, offsets, last_day)
+
+    for day in days:
+        if day < first_day:
+            continue
+        start = timezone.make_aware(datetime.combine(day, time_of_day))
+        end = start + duration
+        if start < window_end and end > window_start:
+            yield start, end
+
+
+def _stepped(day, step, offsets, last_day):
+    while day <= last_day:
+        for offset in sorted(offsets):
+            yield day + timedelta(days=offset)
+        day += timedelta(days=step)
+
+
+def _monthly(first_day, earliest, last_day):
+    year, month = max(
+        (first_day.year, first_day.month), (earliest.year, earliest.month)
+    )
+    while (year, month) <= (last_day.year, last_day.month):
+        if first_day.day <= monthrange(year, month)[1]:
+            yield first_day.replace(year=year, month=month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def feed_events(scope, pk, window_start, window_end):
+    """Events that can have an occurrence in the window, streamed in chunks"""
+    queryset = ScheduledEvent.objects.filter(
+        Q(is_recurring=True) | Q(end_time__gt=window_start),
+        start_time__lt=window_end,
+    ).select_related("facility")
+    if scope == "user":
+        queryset = queryset.filter(users=pk)
+    else:
+        queryset = queryset.filter(facility_id=pk).prefetch_related(
+            Prefetch(
+                "users", queryset=User.objects.only("username", "first_name", "last_name")
+            )
+        )
+    return queryset.order_by("start_time", "pk").iterator(chunk_size=500)
+
+
+def _escape(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    """Fold a content line to 75 octets as RFC 5545 requires"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Never split inside a multi-byte character
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode())
+        encoded = encoded[size:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _utc(moment):
+    return moment.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _vevent(event, start, end, scope):
+    description = event.notes
+    if scope == "facility":
+        staff = ", ".join(
+            user.get_full_name() or user.username for user in event.users.all()
+        )
+        description = f"Staff: {staff}\n\n{description}" if staff else description
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event.pk}-{_utc(start)}@broadcast",
+        f"DTSTAMP:{_utc(event.updated_at)}",
+        f"DTSTART:{_utc(start)}",
+        f"DTEND:{_utc(end)}",
+        f"SUMMARY:{_escape(event.title)}",
+        f"LOCATION:{_escape(event.facility.name)}",
+        f"CATEGORIES:{_escape(event.get_event_type_display())}",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{_escape(description)}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) for line in lines)
+
+
+def render_feed(scope, pk, name):
+    """Yield the feed as chunks of iCalendar text"""
+    today = timezone.make_aware(
+        datetime.combine(timezone.localdate(), datetime.min.time())
+    )
+    window_start = today - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    window_end = today + timedelta(days=settings.CALENDAR_FEED_FUTURE_DAYS + 1)
+
+    yield "".join(
+        _fold(line)
+        for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Broadcast Management System//Schedule//EN",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{_escape(name)}",
+            f"X-PUBLISHED-TTL:PT{max(settings.CALENDAR_FEED_MAX_AGE // 60, 1)}M",
+        )
+    )
+    for event in feed_events(scope, pk, window_start, window_end):
+        chunk = "".join(
+            _vevent(event, start, end, scope)
+            for start, end in occurrences(event, window_start, window_end)
+        )
+        if chunk:
+            yield chunk
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,179 @@
+"""
+Append-only change history for tickets and time-off requests.
+
+Every save or delete of a tracked model produces one HistoryRecord holding
+the changed fields as ``{field: [old, new]}``, who made the change and when.
+A create records every field, a delete records the last state.
+
+Records are not written as the changes happen. Each is queued with
+transaction.on_commit, so changes that are rolled back leave no history,
+and HistoryMiddleware writes everything a request committed with a single
+bulk insert once the view returns. Outside a request (Celery tasks,
+management commands) each record is written when its transaction commits.
+
+Bulk QuerySet.update() and bulk_create() bypass model signals and are not
+recorded.
+"""
+
+import json
+import logging
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from core.middleware import AsyncCapableMiddleware
+
+from .models import HistoryRecord, IncidentTicket, ServiceTicket, TimeOffRequest
+from .sync import model_label
+
+logger = logging.getLogger(__name__)
+
+# URL names of the history endpoint, mapped to the tracked models
+TRACKED_MODELS = {
+    "incident-tickets": IncidentTicket,
+    "service-tickets": ServiceTicket,
+    "time-off-requests": TimeOffRequest,
+}
+
+# The pending records and the request of the current request, if any
+_context = ContextVar("history_context", default=None)
+
+
+def tracked_fields(model):
+    """(name, attname) of the fields whose changes are recorded"""
+    return [
+        (field.name, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+        and not getattr(field, "auto_now", False)
+        and not getattr(field, "auto_now_add", False)
+    ]
+
+
+def _jsonable(values):
+    # Round trip through the encoder so stored and live values compare equal
+    return json.loads(json.dumps(values, cls=DjangoJSONEncoder))
+
+
+def stored_state(model, pk):
+    """The tracked fields of a row as currently stored, or None"""
+    fields = tracked_fields(model)
+    row = (
+        model._base_manager.filter(pk=pk)
+        .values_list(*[attname for _, attname in fields])
+        .first()
+    )
+    if row is None:
+        return None
+    return _jsonable({name: value for (name, _), value in zip(fields, row)})
+
+
+def instance_state(instance):
+    return _jsonable(
+        {
+            name: getattr(instance, attname)
+            for name, attname in tracked_fields(type(instance))
+        }
+    )
+
+
+def diff(old, new):
+    """{field: [old, new]} for the fields that differ between two states"""
+    old, new = old or {}, new or {}
+    return {
+        field: [old.get(field), new.get(field)]
+        for field in new.keys() | old.keys()
+        if old.get(field) != new.get(field)
+    }
+
+
+def _current_user():
+    context = _context.get()
+    user = getattr(context and context["request"], "user", None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def write(records):
+    HistoryRecord.objects.bulk_create(records, batch_size=500)
+
+
+def record_change(instance, action, old, new):
+    """Queue a history record for a change, to be written once it commits"""
+    changes = diff(old, new)
+    if not changes:
+        return
+    user = _current_user()
+    record = HistoryRecord(
+        model=model_label(type(instance)),
+        object_id=instance.pk,
+        action=action,
+        changes=changes,
+        changed_by_id=user.pk if user else None,
+        changed_at=timezone.now(),
+    )
+
+    context = _context.get()
+    if context is not None:
+        transaction.on_commit(partial(context["records"].append, record))
+    else:
+        transaction.on_commit(partial(write, [record]))
+
+
+class HistoryMiddleware(AsyncCapableMiddleware):
+    """Writes the history records of a request with one bulk insert"""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _context.set({"request": request, "records": []})
+        try:
+            return self.get_response(request)
+        finally:
+            records = _context.get()["records"]
+            _context.reset(token)
+            if records:
+                self.save(records)
+
+    async def __acall__(self, request):
+        # Sync views and signal handlers run in a copy of this context, which
+        # shares the records list
+        token = _context.set({"request": request, "records": []})
+        try:
+            return await self.get_response(request)
+        finally:
+            records = _context.get()["records"]
+            _context.reset(token)
+            if records:
+                await sync_to_async(self.save)(records)
+
+    def save(self, records):
+        try:
+            write(records)
+        except Exception:
+            # The changes themselves are committed; don't fail the response
+            logger.exception("Could not write %d history records", len(records))
+
+
+def reconstruct(model, pk, records, at):
+    """
+    State of a tracked row at a moment, or None if it did not exist then
+
+    Works back from the current row (or the last state recorded by its
+    delete), undoing each change made after the moment. records must cover
+    the row's whole history as dicts, ordered oldest first.
+    """
+    state = stored_state(model, pk)
+    for record in reversed(records):
+        if record["changed_at"] <= at:
+            break
+        if record["action"] == "create":
+            return None
+        if state is None:
+            state = {}  # undoing the delete, or a row removed without one
+        for field, (old, _) in record["changes"].items():
+            state[field] = old
+    return state
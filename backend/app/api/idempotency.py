@@ -0,0 +1,161 @@
+"""
+Idempotency-Key support for create endpoints.
+
+A POST carrying an ``Idempotency-Key`` header runs once per user, path and
+key. The response is stored in the cache for IDEMPOTENCY_KEY_TTL seconds and
+replayed to retries without running the view again; failed requests are not
+stored. A lock serializes concurrent requests with the same key: a duplicate
+arriving while the first one runs is answered 409 with Retry-After straight
+away rather than holding a worker while it waits, and its retry gets the
+stored response.
+
+The lock holds a token unique to the request that took it and is only
+released by that request, so a request outliving IDEMPOTENCY_LOCK_TIMEOUT
+cannot release a lock another request has taken since. With Redis behind the
+default cache the lock is taken and released with atomic Redis commands;
+without it (development, tests) it lives in the local cache.
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.cache import get_redis_client, make_key
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+RETRY_AFTER = 1
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_script = None
+_local_lock = threading.Lock()
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(
+        f"{request.user.pk}:{request.method}:{request.path}:{key}".encode()
+    ).hexdigest()
+    return f"idempotency:{digest}"
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored["fingerprint"] != fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used with a different request body"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    headers = dict(stored["headers"])
+    headers["Idempotent-Replayed"] = "true"
+    return Response(stored["data"], status=stored["status"], headers=headers)
+
+
+def acquire_lock(lock_key, token):
+    """Take the lock at lock_key for token; False if someone else holds it"""
+    client = get_redis_client()
+    if client is None:
+        with _local_lock:
+            return cache.add(lock_key, token, settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    return bool(
+        client.set(
+            make_key(lock_key),
+            token,
+            nx=True,
+            ex=settings.IDEMPOTENCY_LOCK_TIMEOUT,
+        )
+    )
+
+
+def release_lock(lock_key, token):
+    """Release the lock at lock_key if token still holds it"""
+    global _release_script
+    client = get_redis_client()
+    if client is None:
+        with _local_lock:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        return
+    if _release_script is None:
+        _release_script = client.register_script(RELEASE_SCRIPT)
+    _release_script(keys=[make_key(lock_key)], args=[token], client=client)
+
+
+def idempotent(request, handler):
+    """Run handler() once per Idempotency-Key, replaying its stored response"""
+    key = request.headers.get(HEADER)
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    result_key = _cache_key(request, key)
+    lock_key = f"{result_key}:lock"
+    fingerprint = _fingerprint(request)
+
+    stored = cache.get(result_key)
+    if stored is not None:
+        return _replay(stored, fingerprint)
+
+    token = uuid.uuid4().hex
+    if not acquire_lock(lock_key, token):
+        return Response(
+            {"error": f"A request with this {HEADER} is still in progress"},
+            status=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+
+    try:
+        # The first request may have stored its response and released the
+        # lock between the lookup above and taking the lock
+        stored = cache.get(result_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        response = handler()
+        # Only successes are stored; a rejected request can be corrected and
+        # retried with the same key
+        if status.is_success(response.status_code):
+            cache.set(
+                result_key,
+                {
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "data": response.data,
+                    "headers": {
+                        name: response[name]
+                        for name in ("Location",)
+                        if response.has_header(name)
+                    },
+                },
+                settings.IDEMPOTENCY_KEY_TTL,
+            )
+        return response
+    finally:
+        release_lock(lock_key, token)
+
+
+class IdempotentCreateMixin:
+    """ViewSet mixin honouring Idempotency-Key on create"""
+
+    def create(self, request, *args, **kwargs):
+        create = super().create
+        return idempotent(request, lambda: create(request, *args, **kwargs))
@@ -0,0 +1,386 @@
+"""
+Streaming bulk import of onboarding data, used by ``manage.py import_records``.
+
+Rows are read one at a time from CSV or JSON Lines input, validated and
+inserted with bulk_create in chunks, so memory use depends on the chunk size
+and the lookup maps, not on the size of the file. References to other rows
+use natural keys (usernames, location and facility names) resolved through
+maps that are loaded once per import.
+"""
+
+import csv
+import json
+from functools import partial
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .authentication import bump_user_versions
+from .feeds import bump_feed_versions
+from .models import Facility, Location, Profile, ScheduledEvent
+
+AMBIGUOUS = object()
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, format):
+    """Yield (line number, dict) pairs from CSV or JSON Lines input"""
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise RowError(f"line {number}: invalid JSON: {e}")
+        if not isinstance(row, dict):
+            raise RowError(f"line {number}: expected a JSON object")
+        yield number, row
+
+
+def _value(row, name, default=None, required=False):
+    value = row.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ""):
+        if required:
+            raise RowError(f"{name} is required")
+        return default
+    return value
+
+
+def _bool(row, name, default):
+    value = _value(row, name, default)
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("1", "true", "yes", "y"):
+        return True
+    if str(value).lower() in ("0", "false", "no", "n"):
+        return False
+    raise RowError(f"{name} must be true or false")
+
+
+def _int(row, name, default=None, required=False):
+    value = _value(row, name, default, required)
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} must be an integer")
+
+
+def _datetime(row, name):
+    value = _value(row, name, required=True)
+    moment = parse_datetime(str(value))
+    if moment is None:
+        raise RowError(f"{name} must be an ISO 8601 datetime")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _date(row, name, default=None):
+    value = _value(row, name)
+    if value is None:
+        return default
+    day = parse_date(str(value))
+    if day is None:
+        raise RowError(f"{name} must be an ISO 8601 date")
+    return day
+
+
+def _name_map(queryset, field):
+    """
+    Map names to ids, marking names shared by several rows as ambiguous
+
+    Returns the map and the set of all ids, which includes the ids behind
+    ambiguous names.
+    """
+    names = {}
+    ids = set()
+    for pk, name in queryset.values_list("pk", field).iterator():
+        names[name] = AMBIGUOUS if name in names else pk
+        ids.add(pk)
+    return names, ids
+
+
+def _resolve(names, ids, row, name, id_field, label):
+    """Resolve a reference given either as <name> or as <id_field>"""
+    pk = _int(row, id_field)
+    if pk is not None:
+        # Checked here so that a dry run reports it, not the database on insert
+        if pk not in ids:
+            raise RowError(f"unknown {label} id {pk}")
+        return pk
+    key = _value(row, name, required=True)
+    pk = names.get(key)
+    if pk is None:
+        raise RowError(f"unknown {label} {key!r}")
+    if pk is AMBIGUOUS:
+        raise RowError(f"{label} name {key!r} is not unique, give {id_field}")
+    return pk
+
+
+class Importer:
+    """
+    Builds model instances from rows and saves them in chunks
+
+    Subclasses set ``model``, implement build() and may return a natural key
+    from key() to detect rows that already exist.
+    """
+
+    model = None
+    exclude_from_validation = ()
+
+    def __init__(self, skip_existing=False):
+        self.skip_existing = skip_existing
+        self.existing = set()
+        self.created = 0
+        self.related = 0
+
+    def key(self, row):
+        return None
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def prepare(self, row):
+        """Return an unsaved instance for the row, or None to skip it"""
+        key = self.key(row)
+        if key is not None and key in self.existing:
+            if self.skip_existing:
+                return None
+            raise RowError(f"{self.model._meta.verbose_name} {key!r} already exists")
+
+        instance = self.build(row)
+        try:
+            # Foreign keys are resolved from the maps; validating them here
+            # would cost a query per row
+            instance.full_clean(
+                exclude=self.exclude_from_validation,
+                validate_unique=False,
+                validate_constraints=False,
+            )
+        except ValidationError as e:
+            raise RowError(
+                "; ".join(f"{field}: {' '.join(errors)}" for field, errors in e)
+            )
+        if key is not None:
+            self.existing.add(key)
+        return instance
+
+    def save(self, chunk):
+        """Insert a chunk of (instance, row) pairs"""
+        self.model.objects.bulk_create([instance for instance, _ in chunk])
+        self.created += len(chunk)
+
+    def finish(self):
+        pass
+
+
+class LocationImporter(Importer):
+    model = Location
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.existing = set(Location.objects.values_list("name", flat=True))
+
+    def key(self, row):
+        return _value(row, "name", required=True)
+
+    def build(self, row):
+        return Location(
+            name=_value(row, "name", required=True),
+            address=_value(row, "address", ""),
+            city=_value(row, "city", ""),
+            state=_value(row, "state", ""),
+            zip_code=_value(row, "zip_code", ""),
+            country=_value(row, "country", "USA"),
+            is_active=_bool(row, "is_active", True),
+        )
+
+
+class FacilityImporter(Importer):
+    model = Facility
+    exclude_from_validation = ("location",)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.locations, self.location_ids = _name_map(Location.objects.all(), "name")
+        self.existing = set(
+            Facility.objects.values_list("location_id", "name").iterator()
+        )
+
+    def location_id(self, row):
+        return _resolve(
+            self.locations,
+            self.location_ids,
+            row,
+            "location",
+            "location_id",
+            "location",
+        )
+
+    def key(self, row):
+        return (self.location_id(row), _value(row, "name", required=True))
+
+    def build(self, row):
+        return Facility(
+            name=_value(row, "name", required=True),
+            location_id=self.location_id(row),
+            facility_type=_value(row, "facility_type", ""),
+            capacity=_int(row, "capacity", 0),
+            is_active=_bool(row, "is_active", True),
+        )
+
+
+class UserImporter(Importer):
+    model = User
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.existing = set(User.objects.values_list("username", flat=True).iterator())
+
+    def key(self, row):
+        return _value(row, "username", required=True)
+
+    def build(self, row):
+        # Hashing is deliberately slow; rows without a password get an
+        # unusable one and set it through the password reset flow
+        return User(
+            username=_value(row, "username", required=True),
+            email=_value(row, "email", ""),
+            first_name=_value(row, "first_name", ""),
+            last_name=_value(row, "last_name", ""),
+            password=make_password(_value(row, "password")),
+            is_active=_bool(row, "is_active", True),
+            is_staff=_bool(row, "is_staff", False),
+        )
+
+
+class ProfileImporter(Importer):
+    model = Profile
+    exclude_from_validation = ("user",)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.users, self.user_ids = _name_map(User.objects.all(), "username")
+        self.existing = set(
+            Profile.objects.values_list("user_id", flat=True).iterator()
+        )
+
+    def user_id(self, row):
+        return _resolve(self.users, self.user_ids, row, "username", "user_id", "user")
+
+    def key(self, row):
+        return self.user_id(row)
+
+    def build(self, row):
+        return Profile(
+            user_id=self.user_id(row),
+            job_title=_value(row, "job_title", ""),
+            department=_value(row, "department", ""),
+            phone_number=_value(row, "phone_number", ""),
+            hire_date=_date(row, "hire_date", timezone.localdate()),
+            is_active=_bool(row, "is_active", True),
+        )
+
+    def save(self, chunk):
+        super().save(chunk)
+        # bulk_create sends no signals; cached users still hold no profile
+        transaction.on_commit(
+            partial(bump_user_versions, {profile.user_id for profile, _ in chunk})
+        )
+
+
+class ScheduledEventImporter(Importer):
+    """
+    Events with their attendees
+
+    ``users`` holds usernames, as a JSON list or separated by ``;`` in CSV.
+    """
+
+    model = ScheduledEvent
+    exclude_from_validation = ("facility", "users")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.facilities, self.facility_ids = _name_map(Facility.objects.all(), "name")
+        self.users = dict(User.objects.values_list("username", "pk").iterator())
+
+    def build(self, row):
+        start_time = _datetime(row, "start_time")
+        end_time = _datetime(row, "end_time")
+        if end_time <= start_time:
+            raise RowError("end_time must be after start_time")
+        event = ScheduledEvent(
+            title=_value(row, "title", required=True),
+            event_type=_value(row, "event_type", "shift"),
+            start_time=start_time,
+            end_time=end_time,
+            facility_id=_resolve(
+                self.facilities,
+                self.facility_ids,
+                row,
+                "facility",
+                "facility_id",
+                "facility",
+            ),
+            is_recurring=_bool(row, "is_recurring", False),
+            recurrence_pattern=_value(row, "recurrence_pattern", ""),
+            notes=_value(row, "notes", ""),
+        )
+        event.attendee_ids = self.attendees(row)
+        return event
+
+    def attendees(self, row):
+        usernames = _value(row, "users", [])
+        if isinstance(usernames, str):
+            usernames = [name.strip() for name in usernames.split(";")]
+        user_ids = []
+        for username in usernames:
+            if not username:
+                continue
+            if username not in self.users:
+                raise RowError(f"unknown user {username!r}")
+            user_ids.append(self.users[username])
+        return user_ids
+
+    def save(self, chunk):
+        events = ScheduledEvent.objects.bulk_create([event for event, _ in chunk])
+        Attendance = ScheduledEvent.users.through
+        attendance = [
+            Attendance(scheduledevent_id=event.pk, user_id=user_id)
+            for event in events
+            for user_id in dict.fromkeys(event.attendee_ids)
+        ]
+        Attendance.objects.bulk_create(attendance)
+        transaction.on_commit(
+            partial(
+                bump_feed_versions,
+                {row.user_id for row in attendance},
+                {event.facility_id for event in events},
+            )
+        )
+        self.created += len(events)
+        self.related += len(attendance)
+
+
+IMPORTERS = {
+    "locations": LocationImporter,
+    "facilities": FacilityImporter,
+    "users": UserImporter,
+    "profiles": ProfileImporter,
+    "events": ScheduledEventImporter,
+}
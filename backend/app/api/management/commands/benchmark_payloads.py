@@ -0,0 +1,132 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from api import sideload
+from api.views import (
+    FacilityViewSet,
+    IncidentTicketViewSet,
+    ProfileViewSet,
+    ScheduledEventViewSet,
+    ServiceTicketViewSet,
+    TimeEntryViewSet,
+    TimeOffRequestViewSet,
+)
+from core.middleware import brotli
+
+ENDPOINTS = {
+    "profiles": ProfileViewSet,
+    "facilities": FacilityViewSet,
+    "incident-tickets": IncidentTicketViewSet,
+    "service-tickets": ServiceTicketViewSet,
+    "time-entries": TimeEntryViewSet,
+    "scheduled-events": ScheduledEventViewSet,
+    "time-off-requests": TimeOffRequestViewSet,
+}
+
+
+def _nested(queryset, serializer_class):
+    return {"results": serializer_class(queryset, many=True, context={}).data}
+
+
+def _sideloaded(queryset, serializer_class):
+    rows, included = sideload.serialize(
+        sideload.prefetch_ids(queryset, serializer_class), serializer_class, {}
+    )
+    return {"results": rows, "included": included}
+
+
+def _measure(build, queryset, serializer_class, repeat):
+    """Mean milliseconds to serialize and render, queries, and the body"""
+    elapsed = 0.0
+    for _ in range(repeat):
+        # A fresh queryset each round, so its result cache is not reused
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            body = JSONRenderer().render(build(queryset.all(), serializer_class))
+            elapsed += time.perf_counter() - started
+    return elapsed / repeat * 1000, len(queries), body
+
+
+def _sizes(body):
+    sizes = [len(body), len(gzip.compress(body, compresslevel=6))]
+    if brotli is not None:
+        sizes.append(
+            len(
+                brotli.compress(
+                    body,
+                    mode=brotli.MODE_TEXT,
+                    quality=settings.COMPRESS_BROTLI_QUALITY,
+                )
+            )
+        )
+    return sizes
+
+
+class Command(BaseCommand):
+    """Django command to compare nested and side-loaded list payloads"""
+
+    help = (
+        "Serialize a page of each list endpoint nested and side-loaded and "
+        "report body sizes, compressed sizes, queries and serialize time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "endpoints",
+            nargs="*",
+            help=f"Endpoints to measure (default: all of {', '.join(ENDPOINTS)})",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+            help="Rows serialized per endpoint (default: the API page size)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Serialize each format this many times and report the mean (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["endpoints"]) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        columns = ["bytes", "gzip"] + (["br"] if brotli is not None else [])
+        self.stdout.write(
+            f"{'endpoint':<18} {'format':<8} {'rows':>5} "
+            + " ".join(f"{column:>9}" for column in columns)
+            + f" {'queries':>7} {'ms':>8}"
+        )
+        for name in options["endpoints"] or ENDPOINTS:
+            viewset = ENDPOINTS[name]
+            queryset = viewset.queryset.order_by("pk")[: options["limit"]]
+            rows = queryset.count()
+            nested_bytes = None
+            for label, build in (("nested", _nested), ("sideload", _sideloaded)):
+                ms, queries, body = _measure(
+                    build, queryset, viewset.serializer_class, options["repeat"]
+                )
+                sizes = _sizes(body)
+                self.stdout.write(
+                    f"{name:<18} {label:<8} {rows:5d} "
+                    + " ".join(f"{size:9d}" for size in sizes)
+                    + f" {queries:7d} {ms:8.1f}"
+                )
+                if nested_bytes is None:
+                    nested_bytes = sizes[0]
+                elif rows:
+                    self.stdout.write(
+                        f"{'':<18} {'':<8} {'':>5} "
+                        f"{sizes[0] / nested_bytes:9.0%} of the nested size"
+                    )
@@ -0,0 +1,110 @@
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.imports import IMPORTERS, RowError, read_rows
+
+MAX_REPORTED_ERRORS = 20
+
+
+class DryRunRollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """Django command to bulk import onboarding data from CSV or JSON Lines"""
+
+    help = (
+        "Stream locations, facilities, users, profiles or scheduled events from "
+        "a CSV or JSON Lines file and insert them in bulk"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path", help="Input file, or - for stdin")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format (default: from the file extension, else csv)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows per bulk insert (default: 2000)",
+        )
+        parser.add_argument(
+            "--skip-existing",
+            action="store_true",
+            help="Skip rows whose natural key already exists instead of failing",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate every row and roll back instead of committing",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or ("jsonl" if path.endswith(".jsonl") else "csv")
+        importer = IMPORTERS[options["kind"]](skip_existing=options["skip_existing"])
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            with transaction.atomic():
+                errors, skipped = self.run(importer, read_rows(stream, format), options)
+                if errors or options["dry_run"]:
+                    raise DryRunRollback
+                importer.finish()
+        except DryRunRollback:
+            pass
+        except RowError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(error)
+        if len(errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"... and {len(errors) - MAX_REPORTED_ERRORS} more")
+
+        summary = f"{importer.created} {options['kind']}"
+        if importer.related:
+            summary += f" with {importer.related} attendance rows"
+        if skipped:
+            summary += f", {skipped} existing rows skipped"
+
+        if errors:
+            raise CommandError(f"{len(errors)} invalid rows, nothing was imported")
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: would import {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {summary}"))
+
+    def run(self, importer, rows, options):
+        """Validate every row, inserting valid chunks until the first error"""
+        errors = []
+        skipped = 0
+        while True:
+            batch = list(islice(rows, options["chunk_size"]))
+            if not batch:
+                break
+            chunk = []
+            for number, row in batch:
+                try:
+                    instance = importer.prepare(row)
+                except RowError as e:
+                    errors.append(f"Line {number}: {e}")
+                    continue
+                if instance is None:
+                    skipped += 1
+                else:
+                    chunk.append((instance, row))
+            # Inserting during a dry run too keeps its timing and database
+            # errors realistic; the transaction is rolled back either way
+            if chunk and not errors:
+                importer.save(chunk)
+        return errors, skipped
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import find_drift, recompute_counters
+
+
+class Command(BaseCommand):
+    """Django command to detect and repair drift in the ticket counters"""
+
+    help = "Compare ticket counters with the ticket tables and repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drift without repairing it",
+        )
+
+    def handle(self, *args, **options):
+        facility_drift, user_drift = find_drift()
+
+        for pk, stored, expected in facility_drift:
+            self.stdout.write(
+                f"Facility {pk}: stored {stored}, expected {expected}"
+            )
+        for pk, stored, expected in user_drift:
+            self.stdout.write(f"User {pk}: stored {stored}, expected {expected}")
+
+        if not facility_drift and not user_drift:
+            self.stdout.write(self.style.SUCCESS("Ticket counters are in sync"))
+            return
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(facility_drift)} facility and {len(user_drift)} "
+                    "user counters out of sync"
+                )
+            )
+            return
+
+        with transaction.atomic():
+            recompute_counters(
+                {pk for pk, _, _ in facility_drift},
+                {pk for pk, _, _ in user_drift},
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Repaired {len(facility_drift)} facility and {len(user_drift)} "
+                "user counters"
+            )
+        )
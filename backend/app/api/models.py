@@ -1,8 +1,50 @@
+from functools import partial
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.utils import timezone
 
 
+class SyncQuerySet(models.QuerySet):
+    """
+    QuerySet for models served by delta sync
+
+    Bulk updates bypass auto_now, so they stamp updated_at here to keep the
+    rows visible to ?since= queries.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault("updated_at", timezone.now())
+        return super().update(**kwargs)
+
+
+class ReferenceQuerySet(SyncQuerySet):
+    """
+    QuerySet for models cached in the bootstrap reference sections
+
+    Bulk writes send no post_save signal, so they drop the cached sections
+    here once they commit. bulk_update() goes through update().
+    """
+
+    def _invalidate_on_commit(self):
+        from .bootstrap import invalidate_reference_sections
+
+        transaction.on_commit(
+            partial(invalidate_reference_sections, self.model), using=self.db
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._invalidate_on_commit()
+        return objs
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        self._invalidate_on_commit()
+        return rows
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     job_title = models.CharField(max_length=100)
@@ -23,6 +65,9 @@ class Location(models.Model):
     zip_code = models.CharField(max_length=20)
     country = models.CharField(max_length=100, default="USA")
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ReferenceQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -36,6 +81,9 @@ class Facility(models.Model):
     facility_type = models.CharField(max_length=100)
     capacity = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ReferenceQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -47,6 +95,9 @@ class Shift(models.Model):
     end_time = models.TimeField()
     is_overnight = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ReferenceQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -59,12 +110,73 @@ class IncidentType(models.Model):
         choices=[(1, "Low"), (2, "Medium"), (3, "High"), (4, "Critical")], default=2
     )
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ReferenceQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
 
-class IncidentTicket(models.Model):
+class TicketQuerySet(SyncQuerySet):
+    """QuerySet that keeps the ticket counters in sync through bulk writes"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .counters import apply_ticket_deltas, ticket_key
+
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            apply_ticket_deltas(self.model, [(None, ticket_key(obj)) for obj in objs])
+        return objs
+
+    def update(self, **kwargs):
+        from .counters import COUNTED_FIELDS, affected_keys, recompute_counters
+
+        if not COUNTED_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            facility_ids, user_ids = affected_keys(self)
+            rows = super().update(**kwargs)
+            for field in ("facility", "facility_id"):
+                if kwargs.get(field) is not None:
+                    facility_ids.add(getattr(kwargs[field], "pk", kwargs[field]))
+            for field in ("assigned_to", "assigned_to_id"):
+                if kwargs.get(field) is not None:
+                    user_ids.add(getattr(kwargs[field], "pk", kwargs[field]))
+            recompute_counters(facility_ids, user_ids)
+        return rows
+
+
+class CountedTicket(models.Model):
+    """Base for tickets whose open counts are denormalized into counter tables"""
+
+    objects = TicketQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .counters import apply_ticket_deltas, stored_ticket_key, ticket_key
+        from .history import stored_state
+
+        with transaction.atomic():
+            stored = None
+            if not self._state.adding and self.pk is not None:
+                stored = stored_state(type(self), self.pk)
+            # The history's pre_save receiver takes the row from here instead
+            # of reading it a second time
+            self._stored_state = stored
+            try:
+                super().save(*args, **kwargs)
+            finally:
+                self.__dict__.pop("_stored_state", None)
+            apply_ticket_deltas(
+                type(self), [(stored_ticket_key(type(self), stored), ticket_key(self))]
+            )
+
+
+class IncidentTicket(CountedTicket):
     STATUS_CHOICES = [
         ("open", "Open"),
         ("in_progress", "In Progress"),
@@ -72,6 +184,7 @@ class IncidentTicket(models.Model):
         ("resolved", "Resolved"),
         ("closed", "Closed"),
     ]
+    OPEN_STATUSES = ("open", "in_progress", "on_hold")
 
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -88,15 +201,15 @@ class IncidentTicket(models.Model):
     incident_type = models.ForeignKey(IncidentType, on_delete=models.CASCADE)
     facility = models.ForeignKey(Facility, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="open")
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.title
 
 
-class ServiceTicket(models.Model):
+class ServiceTicket(CountedTicket):
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("approved", "Approved"),
@@ -104,6 +217,7 @@ class ServiceTicket(models.Model):
         ("completed", "Completed"),
         ("rejected", "Rejected"),
     ]
+    OPEN_STATUSES = ("pending", "approved", "in_progress")
 
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -119,14 +233,34 @@ class ServiceTicket(models.Model):
     )
     facility = models.ForeignKey(Facility, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.title
 
 
+class TimeEntryQuerySet(models.QuerySet):
+    """QuerySet that queues the report weeks of bulk-updated punches"""
+
+    def update(self, **kwargs):
+        from .reports import PUNCH_FIELDS, mark_stale
+
+        if not PUNCH_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            old = dict(self.values_list("pk", "timestamp"))
+            rows = super().update(**kwargs)
+            moments = list(old.values())
+            if "timestamp" in kwargs:
+                moved = self.model._base_manager.using(self.db).filter(pk__in=list(old))
+                moments += moved.values_list("timestamp", flat=True)
+            mark_stale(moments)
+        return rows
+
+
 class TimeEntry(models.Model):
     ENTRY_TYPE_CHOICES = [
         ("clock_in", "Clock In"),
@@ -139,10 +273,12 @@ class TimeEntry(models.Model):
         User, on_delete=models.CASCADE, related_name="time_entries"
     )
     entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
-    timestamp = models.DateTimeField(default=timezone.now)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     note = models.TextField(blank=True)
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
 
+    objects = TimeEntryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.entry_type} - {self.timestamp}"
 
@@ -157,7 +293,7 @@ class ScheduledEvent(models.Model):
 
     title = models.CharField(max_length=200)
     event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES)
-    start_time = models.DateTimeField()
+    start_time = models.DateTimeField(db_index=True)
     end_time = models.DateTimeField()
     users = models.ManyToManyField(User, related_name="scheduled_events")
     facility = models.ForeignKey(Facility, on_delete=models.CASCADE)
@@ -165,7 +301,15 @@ class ScheduledEvent(models.Model):
     recurrence_pattern = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = SyncQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Point-in-time "who is on duty at this facility" lookups
+            models.Index(fields=["facility", "start_time", "end_time"]),
+        ]
 
     def __str__(self):
         return self.title
@@ -191,7 +335,7 @@ class TimeOffRequest(models.Model):
         User, on_delete=models.CASCADE, related_name="time_off_requests"
     )
     request_type = models.CharField(max_length=20, choices=REQUEST_TYPE_CHOICES)
-    start_date = models.DateField()
+    start_date = models.DateField(db_index=True)
     end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     reason = models.TextField()
@@ -204,7 +348,196 @@ class TimeOffRequest(models.Model):
     )
     reviewed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = SyncQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user.username} - {self.request_type} - {self.start_date} to {self.end_date}"
+
+
+class FacilityTicketCounter(models.Model):
+    """Denormalized open ticket counts per facility, maintained by api.counters"""
+
+    facility = models.OneToOneField(
+        Facility,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="ticket_counter",
+    )
+    open_incidents = models.IntegerField(default=0)
+    open_services = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.facility} - {self.open_incidents} incidents, {self.open_services} services"
+
+
+class UserTicketCounter(models.Model):
+    """Denormalized open ticket workload per assignee, maintained by api.counters"""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="ticket_counter",
+    )
+    assigned_incidents = models.IntegerField(default=0)
+    assigned_services = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.assigned_incidents} incidents, {self.assigned_services} services"
+
+
+class DeletionLog(models.Model):
+    """Tombstones for rows deleted from delta-synced models"""
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["model", "deleted_at"])]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
+
+
+class CalendarFeedKey(models.Model):
+    """Secret mixed into the signed URL of a calendar feed, see api.feeds"""
+
+    scope = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    key = models.CharField(max_length=32)
+    rotated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "object_id"], name="unique_calendar_feed_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.object_id} feed key"
+
+
+class HistoryRecord(models.Model):
+    """One append-only change to a tracked row, written by api.history"""
+
+    ACTION_CHOICES = [
+        ("create", "Created"),
+        ("update", "Updated"),
+        ("delete", "Deleted"),
+    ]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # {field: [old value, new value]} for the fields that changed
+    changes = models.JSONField(encoder=DjangoJSONEncoder)
+    changed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["model", "object_id", "changed_at"])]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("History records are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("History records are append-only")
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} {self.action} at {self.changed_at}"
+
+
+class WeeklyUserHours(models.Model):
+    """Hours worked per user per week, maintained by api.reports"""
+
+    week = models.DateField(help_text="Monday of the week")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="weekly_hours"
+    )
+    department = models.CharField(max_length=100, blank=True)
+    hours = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["week", "user"], name="unique_user_week")
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - week of {self.week}: {self.hours}h"
+
+
+class WeeklyDepartmentHours(models.Model):
+    """Hours worked per Profile.department per week, maintained by api.reports"""
+
+    week = models.DateField(help_text="Monday of the week")
+    department = models.CharField(max_length=100, blank=True)
+    hours = models.FloatField(default=0)
+    staff = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["week", "department"], name="unique_department_week"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.department or 'No department'} - week of {self.week}: {self.hours}h"
+
+
+class WeeklyFacilityHours(models.Model):
+    """
+    Hours worked per facility per week, maintained by api.reports
+
+    Hours are attributed to the facility of the shift or overtime event that
+    overlaps them; hours worked outside any scheduled event have no facility.
+    """
+
+    week = models.DateField(help_text="Monday of the week")
+    facility = models.ForeignKey(
+        Facility,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="weekly_hours",
+    )
+    hours = models.FloatField(default=0)
+    staff = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["week", "facility"])]
+
+    def __str__(self):
+        return f"{self.facility or 'Unscheduled'} - week of {self.week}: {self.hours}h"
+
+
+class ReportWatermark(models.Model):
+    """The last TimeEntry id a report refresh has processed"""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # Ids below last_id not seen yet, which late commits may still fill
+    pending_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_id}"
+
+
+class StaleReportWeek(models.Model):
+    """A week whose report rows must be recomputed after a punch was edited"""
+
+    week = models.DateField(unique=True)
+
+    def __str__(self):
+        return f"Week of {self.week}"
@@ -0,0 +1,156 @@
+"""
+On-call notifications for high-priority incidents.
+
+Creating an IncidentTicket whose type has priority_level of at least
+ONCALL_NOTIFY_MIN_PRIORITY enqueues one Celery task once the transaction
+commits, so ticket creation never waits on the database lookups or mail
+delivery. The task resolves who is on duty at the ticket's facility at the
+time the ticket was created and sends to them in batches of
+ONCALL_NOTIFICATION_BATCH_SIZE through every channel in
+ONCALL_NOTIFICATION_CHANNELS.
+
+Each (ticket, channel, user) delivery is remembered in the cache for
+ONCALL_DEDUPE_TTL seconds, so task retries and repeated triggers for the
+same ticket don't notify anyone twice.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.utils.module_loading import import_string
+
+from .models import IncidentTicket
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationChannel:
+    """
+    A way of reaching on-call staff
+
+    Subclasses set ``name`` and implement send_batch(). Add them to
+    ONCALL_NOTIFICATION_CHANNELS by dotted path.
+    """
+
+    name = None
+
+    def send_batch(self, ticket, users):
+        """Notify users about ticket; return the users that were reached"""
+        raise NotImplementedError
+
+
+class EmailChannel(NotificationChannel):
+    """One email per recipient, sent over a single SMTP connection per batch"""
+
+    name = "email"
+
+    def send_batch(self, ticket, users):
+        users = [user for user in users if user.email]
+        subject = (
+            f"[{ticket.incident_type.get_priority_level_display()}] "
+            f"Incident at {ticket.facility.name}: {ticket.title}"
+        )
+        body = (
+            f"{ticket.title}\n\n"
+            f"Type: {ticket.incident_type.name}\n"
+            f"Facility: {ticket.facility.name}\n"
+            f"Reported by: {ticket.created_by.get_username()}\n"
+            f"Reported at: {ticket.created_at:%Y-%m-%d %H:%M %Z}\n\n"
+            f"{ticket.description}"
+        )
+        messages = [
+            EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [user.email])
+            for user in users
+        ]
+        with get_connection() as connection:
+            connection.send_messages(messages)
+        return users
+
+
+def get_channels():
+    return [import_string(path)() for path in settings.ONCALL_NOTIFICATION_CHANNELS]
+
+
+def on_duty_users(facility_id, at):
+    """
+    Active users with a shift or overtime event at the facility covering at
+
+    Only events that started within ONCALL_MAX_EVENT_HOURS of at are
+    considered, which keeps the lookup a short range scan of the
+    (facility, start_time, end_time) index.
+    """
+    earliest = at - timedelta(hours=settings.ONCALL_MAX_EVENT_HOURS)
+    return User.objects.filter(
+        is_active=True,
+        scheduled_events__facility_id=facility_id,
+        scheduled_events__event_type__in=settings.ONCALL_EVENT_TYPES,
+        scheduled_events__start_time__gte=earliest,
+        scheduled_events__start_time__lte=at,
+        scheduled_events__end_time__gt=at,
+    ).distinct()
+
+
+def _sent_key(ticket_id, channel, user_id):
+    return f"oncall:sent:{ticket_id}:{channel}:{user_id}"
+
+
+def notify_on_call(ticket_id):
+    """Notify everyone on duty at the ticket's facility; return the count sent"""
+    ticket = (
+        IncidentTicket.objects.select_related("incident_type", "facility", "created_by")
+        .filter(pk=ticket_id)
+        .first()
+    )
+    if ticket is None:
+        return 0
+
+    lock_key = f"oncall:lock:{ticket_id}"
+    if not cache.add(lock_key, 1, settings.ONCALL_NOTIFICATION_LOCK_TIMEOUT):
+        return 0  # another run for this ticket is in progress
+
+    try:
+        users = list(
+            on_duty_users(ticket.facility_id, ticket.created_at)
+            .exclude(pk=ticket.created_by_id)
+            .order_by("pk")
+        )
+
+        sent = 0
+        size = settings.ONCALL_NOTIFICATION_BATCH_SIZE
+        for channel in get_channels():
+            for start in range(0, len(users), size):
+                batch = users[start : start + size]
+                keys = {
+                    user.pk: _sent_key(ticket.pk, channel.name, user.pk)
+                    for user in batch
+                }
+                already = cache.get_many(keys.values())
+                batch = [user for user in batch if keys[user.pk] not in already]
+                if not batch:
+                    continue
+                reached = channel.send_batch(ticket, batch)
+                cache.set_many(
+                    {keys[user.pk]: 1 for user in reached}, settings.ONCALL_DEDUPE_TTL
+                )
+                sent += len(reached)
+        return sent
+    finally:
+        cache.delete(lock_key)
+
+
+def should_notify(ticket):
+    return ticket.incident_type.priority_level >= settings.ONCALL_NOTIFY_MIN_PRIORITY
+
+
+def enqueue_on_call_notification(ticket_id):
+    """Queue the notification task; a broker outage must not fail the request"""
+    from .tasks import notify_on_call_task
+
+    try:
+        notify_on_call_task.delay(ticket_id)
+    except Exception:
+        logger.exception("Could not queue on-call notification for %s", ticket_id)
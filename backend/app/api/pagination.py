@@ -0,0 +1,38 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap enough to run
+ESTIMATE_THRESHOLD = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses PostgreSQL's planner estimate for unfiltered counts
+
+    COUNT(*) over a multi-million row table is a sequential scan. When the
+    queryset has no filters the row estimate in pg_class is used instead;
+    filtered querysets, small tables and other databases get an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is None or query.where or query.distinct:
+            return super().count
+
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return super().count
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        estimate = row[0] if row else -1
+        if estimate < ESTIMATE_THRESHOLD:
+            return super().count
+        return estimate
@@ -0,0 +1,252 @@
+"""
+Weekly hours reports.
+
+Clock punches are paired into worked sessions (clock_in to clock_out, minus
+breaks) and summed per week into WeeklyUserHours, WeeklyDepartmentHours and
+WeeklyFacilityHours. A session belongs to the week its clock_in falls in;
+weeks start on Monday in TIME_ZONE.
+
+refresh_weekly_hours() runs from Celery beat. It reads the TimeEntry ids
+added since the last run's high-water mark, works out which weeks those
+punches can affect (late punches included, whatever their timestamp) and
+recomputes just those weeks. Weeks of edited or deleted punches are queued
+as StaleReportWeek rows by signals, or by TimeEntryQuerySet.update() for
+bulk updates, and picked up by the same run. The report endpoint reads only
+the summary tables.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Profile,
+    ReportWatermark,
+    ScheduledEvent,
+    StaleReportWeek,
+    TimeEntry,
+    WeeklyDepartmentHours,
+    WeeklyFacilityHours,
+    WeeklyUserHours,
+)
+
+WATERMARK = "weekly_hours"
+WORK_EVENT_TYPES = ("shift", "overtime")
+# TimeEntry fields that change how punches pair into sessions
+PUNCH_FIELDS = {"user", "user_id", "entry_type", "timestamp"}
+
+
+def week_start(day):
+    """Monday of the week containing a date"""
+    return day - timedelta(days=day.weekday())
+
+
+def week_of(moment):
+    """Monday of the week containing a datetime"""
+    return week_start(timezone.localtime(moment).date())
+
+
+def affected_weeks(moment):
+    """Weeks whose sessions a punch at moment can change"""
+    max_shift = timedelta(hours=settings.REPORT_MAX_SHIFT_HOURS)
+    return {week_of(moment), week_of(moment - max_shift)}
+
+
+def mark_stale(moments):
+    """
+    Queue the weeks touched by edited or deleted punches for recomputation
+
+    Called by the TimeEntry signals and by TimeEntryQuerySet.update(). Raw SQL
+    writes to TimeEntry must call it themselves.
+    """
+    weeks = set()
+    for moment in moments:
+        weeks |= affected_weeks(moment)
+    StaleReportWeek.objects.bulk_create(
+        [StaleReportWeek(week=week) for week in weeks], ignore_conflicts=True
+    )
+
+
+def pair_sessions(punches):
+    """
+    Pair one user's punches, ordered by time, into (start, end, seconds) sessions
+
+    A clock_in without a matching clock_out is dropped when the next
+    clock_in arrives, as are sessions longer than REPORT_MAX_SHIFT_HOURS.
+    """
+    max_shift = timedelta(hours=settings.REPORT_MAX_SHIFT_HOURS)
+    sessions = []
+    start = break_start = None
+    paused = 0.0
+    for moment, entry_type in punches:
+        if entry_type == "clock_in":
+            start, break_start, paused = moment, None, 0.0
+        elif start is None:
+            continue
+        elif entry_type == "break_start":
+            break_start = break_start or moment
+        elif entry_type == "break_end" and break_start is not None:
+            paused += (moment - break_start).total_seconds()
+            break_start = None
+        elif entry_type == "clock_out":
+            if break_start is not None:
+                paused += (moment - break_start).total_seconds()
+            if moment - start <= max_shift:
+                worked = (moment - start).total_seconds() - paused
+                sessions.append((start, moment, max(worked, 0.0)))
+            start = break_start = None
+    return sessions
+
+
+def facility_for(start, end, events):
+    """Facility of the work event overlapping the session most, if any"""
+    best, best_overlap = None, timedelta(0)
+    for event_start, event_end, facility_id in events:
+        overlap = min(end, event_end) - max(start, event_start)
+        if overlap > best_overlap:
+            best, best_overlap = facility_id, overlap
+    return best
+
+
+def compute_week(week):
+    """Return the user, department and facility rows for one week"""
+    max_shift = timedelta(hours=settings.REPORT_MAX_SHIFT_HOURS)
+    begins = timezone.make_aware(datetime.combine(week, datetime.min.time()))
+    ends = begins + timedelta(days=7)
+
+    punches = defaultdict(list)
+    entries = (
+        TimeEntry.objects.filter(
+            timestamp__gte=begins, timestamp__lt=ends + max_shift
+        )
+        .order_by("user_id", "timestamp", "pk")
+        .values_list("user_id", "timestamp", "entry_type")
+    )
+    for user_id, moment, entry_type in entries.iterator():
+        punches[user_id].append((moment, entry_type))
+
+    events = defaultdict(list)
+    Attendance = ScheduledEvent.users.through
+    attendance = Attendance.objects.filter(
+        user_id__in=list(punches),
+        scheduledevent__event_type__in=WORK_EVENT_TYPES,
+        scheduledevent__start_time__lt=ends + max_shift,
+        scheduledevent__end_time__gt=begins,
+    ).values_list(
+        "user_id",
+        "scheduledevent__start_time",
+        "scheduledevent__end_time",
+        "scheduledevent__facility_id",
+    )
+    for user_id, start, end, facility_id in attendance:
+        events[user_id].append((start, end, facility_id))
+
+    departments = dict(
+        Profile.objects.filter(user_id__in=list(punches)).values_list(
+            "user_id", "department"
+        )
+    )
+
+    user_hours = defaultdict(float)
+    facility_hours = defaultdict(lambda: [0.0, set()])
+    for user_id, user_punches in punches.items():
+        for start, end, seconds in pair_sessions(user_punches):
+            if not begins <= start < ends:
+                continue
+            hours = seconds / 3600
+            user_hours[user_id] += hours
+            totals = facility_hours[facility_for(start, end, events[user_id])]
+            totals[0] += hours
+            totals[1].add(user_id)
+
+    department_hours = defaultdict(lambda: [0.0, 0])
+    for user_id, hours in user_hours.items():
+        totals = department_hours[departments.get(user_id, "")]
+        totals[0] += hours
+        totals[1] += 1
+
+    return (
+        [
+            WeeklyUserHours(
+                week=week,
+                user_id=user_id,
+                department=departments.get(user_id, ""),
+                hours=round(hours, 2),
+            )
+            for user_id, hours in user_hours.items()
+        ],
+        [
+            WeeklyDepartmentHours(
+                week=week, department=department, hours=round(hours, 2), staff=staff
+            )
+            for department, (hours, staff) in department_hours.items()
+        ],
+        [
+            WeeklyFacilityHours(
+                week=week,
+                facility_id=facility_id,
+                hours=round(hours, 2),
+                staff=len(staff),
+            )
+            for facility_id, (hours, staff) in facility_hours.items()
+        ],
+    )
+
+
+def refresh_weeks(weeks):
+    """Replace the report rows of each week with freshly computed ones"""
+    for week in sorted(weeks):
+        users, departments, facilities = compute_week(week)
+        with transaction.atomic():
+            for model, rows in (
+                (WeeklyUserHours, users),
+                (WeeklyDepartmentHours, departments),
+                (WeeklyFacilityHours, facilities),
+            ):
+                model.objects.filter(week=week).delete()
+                model.objects.bulk_create(rows, batch_size=1000)
+
+
+def refresh_weekly_hours():
+    """
+    Recompute the weeks affected by new, edited or deleted punches
+
+    New punches are found from the id high-water mark. Ids below the mark
+    that were missing when it moved may belong to transactions that had not
+    committed yet, so the mark keeps those within REPORT_WATERMARK_OVERLAP
+    of it and the next run looks them up again.
+    """
+    with transaction.atomic():
+        # The row lock keeps concurrent refreshes from interleaving
+        mark, _ = ReportWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK
+        )
+
+        weeks = set()
+        seen = set()
+        new_entries = TimeEntry.objects.filter(
+            Q(pk__gt=mark.last_id) | Q(pk__in=mark.pending_ids)
+        ).values_list("pk", "timestamp")
+        for pk, moment in new_entries.iterator():
+            weeks |= affected_weeks(moment)
+            seen.add(pk)
+
+        last_id = max(seen | {mark.last_id})
+        floor = last_id - settings.REPORT_WATERMARK_OVERLAP
+        skipped = range(max(mark.last_id, floor) + 1, last_id)
+        pending = set(mark.pending_ids).union(skipped) - seen
+
+        stale = list(StaleReportWeek.objects.values_list("pk", "week"))
+        weeks |= {week for _, week in stale}
+
+        refresh_weeks(weeks)
+        StaleReportWeek.objects.filter(pk__in=[pk for pk, _ in stale]).delete()
+        mark.last_id = last_id
+        mark.pending_ids = sorted(pk for pk in pending if pk > floor)
+        mark.save()
+
+    return {"weeks": len(weeks), "last_id": last_id}
@@ -0,0 +1,331 @@
+"""
+Automatic shift roster generation.
+
+A roster fills every (day, facility, shift) slot in a date range with up to
+Facility.capacity active staff. Slots are filled in start order by a greedy
+pass that offers each slot to the least-loaded eligible staff first, then a
+local search moves shifts from heavily to lightly loaded staff to even out
+hours. Staff are eligible for a slot when they have no approved time off on
+its days, keep the minimum rest around it and stay under the weekly hour
+limit. Existing events count as commitments, and existing shift events for
+a slot are topped up instead of duplicated.
+"""
+
+import heapq
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .feeds import bump_feed_versions
+from .models import Facility, Profile, ScheduledEvent, Shift, TimeOffRequest
+
+
+@dataclass
+class Slot:
+    facility_id: int
+    title: str
+    start: datetime
+    end: datetime
+    needed: int
+    event_id: int = None
+    assigned: list = field(default_factory=list)
+
+    @property
+    def hours(self):
+        return (self.end - self.start).total_seconds() / 3600
+
+
+class StaffCalendar:
+    """Commitments of one staff member, used for eligibility checks"""
+
+    __slots__ = ("user_id", "intervals", "days_off", "week_hours", "hours")
+
+    def __init__(self, user_id, days_off=()):
+        self.user_id = user_id
+        self.intervals = []
+        self.days_off = set(days_off)
+        self.week_hours = defaultdict(float)
+        self.hours = 0.0
+
+    def can_take(self, start, end, min_rest, max_week_hours):
+        day = start.date()
+        while day <= end.date():
+            if day in self.days_off:
+                return False
+            day += timedelta(days=1)
+
+        hours = (end - start).total_seconds() / 3600
+        if self.week_hours[start.isocalendar()[:2]] + hours > max_week_hours:
+            return False
+
+        index = bisect_left(self.intervals, (start, end))
+        if index and self.intervals[index - 1][1] + min_rest > start:
+            return False
+        if index < len(self.intervals) and end + min_rest > self.intervals[index][0]:
+            return False
+        return True
+
+    def add(self, start, end, counted=True):
+        insort(self.intervals, (start, end))
+        hours = (end - start).total_seconds() / 3600
+        self.week_hours[start.isocalendar()[:2]] += hours
+        if counted:
+            self.hours += hours
+
+    def remove(self, start, end):
+        self.intervals.remove((start, end))
+        hours = (end - start).total_seconds() / 3600
+        self.week_hours[start.isocalendar()[:2]] -= hours
+        self.hours -= hours
+
+
+def assign_greedy(slots, calendars, min_rest, max_week_hours):
+    """Fill slots in start order, least-loaded eligible staff first"""
+    heap = [(calendar.hours, user_id) for user_id, calendar in calendars.items()]
+    heapq.heapify(heap)
+
+    for slot in sorted(slots, key=lambda slot: slot.start):
+        skipped = []
+        while len(slot.assigned) < slot.needed and heap:
+            hours, user_id = heapq.heappop(heap)
+            calendar = calendars[user_id]
+            if hours != calendar.hours:
+                continue  # stale entry, a fresher one is in the heap
+            if user_id not in slot.assigned and calendar.can_take(
+                slot.start, slot.end, min_rest, max_week_hours
+            ):
+                calendar.add(slot.start, slot.end)
+                slot.assigned.append(user_id)
+                heapq.heappush(heap, (calendar.hours, user_id))
+            else:
+                skipped.append((hours, user_id))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+
+
+def rebalance(slots, calendars, min_rest, max_week_hours, passes, candidates=25):
+    """
+    Local search: move shifts from the most to the least loaded staff
+
+    A move is kept only when the receiving staff member is eligible and ends
+    up with fewer hours than the giver had, so every move narrows the spread.
+    """
+    for _ in range(passes):
+        moved = 0
+        average = sum(c.hours for c in calendars.values()) / max(len(calendars), 1)
+        light = sorted(calendars.values(), key=lambda calendar: calendar.hours)
+        for slot in slots:
+            for position, user_id in enumerate(slot.assigned):
+                giver = calendars[user_id]
+                if giver.hours - slot.hours < average:
+                    continue
+                for taker in light[:candidates]:
+                    if taker.hours + slot.hours >= giver.hours:
+                        break
+                    if taker.user_id in slot.assigned:
+                        continue
+                    if taker.can_take(slot.start, slot.end, min_rest, max_week_hours):
+                        giver.remove(slot.start, slot.end)
+                        taker.add(slot.start, slot.end)
+                        slot.assigned[position] = taker.user_id
+                        moved += 1
+                        break
+            light.sort(key=lambda calendar: calendar.hours)
+        if not moved:
+            break
+
+
+def _aware(day, time):
+    return timezone.make_aware(datetime.combine(day, time))
+
+
+def build_slots(start_date, end_date, facilities, shifts):
+    """One slot per day, facility and shift in the inclusive date range"""
+    slots = []
+    day = start_date
+    while day <= end_date:
+        for shift in shifts:
+            start = _aware(day, shift.start_time)
+            end_day = day + timedelta(days=1) if shift.is_overnight else day
+            end = _aware(end_day, shift.end_time)
+            for facility in facilities:
+                slots.append(
+                    Slot(
+                        facility_id=facility.pk,
+                        title=f"{shift.name} - {facility.name}",
+                        start=start,
+                        end=end,
+                        needed=facility.capacity,
+                    )
+                )
+        day += timedelta(days=1)
+    return slots
+
+
+def load_calendars(start_date, end_date, window_start, window_end):
+    """Build a StaffCalendar for every active staff member"""
+    user_ids = Profile.objects.filter(is_active=True, user__is_active=True).values_list(
+        "user_id", flat=True
+    )
+    calendars = {user_id: StaffCalendar(user_id) for user_id in user_ids}
+
+    time_off = TimeOffRequest.objects.filter(
+        status="approved", start_date__lte=end_date, end_date__gte=start_date
+    ).values_list("user_id", "start_date", "end_date")
+    for user_id, first, last in time_off:
+        calendar = calendars.get(user_id)
+        if calendar is None:
+            continue
+        day = max(first, start_date - timedelta(days=1))
+        while day <= min(last, end_date + timedelta(days=1)):
+            calendar.days_off.add(day)
+            day += timedelta(days=1)
+
+    # Existing events are commitments, but don't count towards load balancing
+    Attendance = ScheduledEvent.users.through
+    commitments = Attendance.objects.filter(
+        scheduledevent__start_time__lt=window_end,
+        scheduledevent__end_time__gt=window_start,
+    ).values_list("user_id", "scheduledevent__start_time", "scheduledevent__end_time")
+    for user_id, start, end in commitments:
+        calendar = calendars.get(user_id)
+        if calendar is not None:
+            calendar.add(start, end, counted=False)
+    return calendars
+
+
+def attach_existing_events(slots, facility_ids):
+    """Point slots at matching existing shift events and reduce their demand"""
+    if not slots:
+        return
+    existing = (
+        ScheduledEvent.objects.filter(
+            event_type="shift",
+            facility_id__in=facility_ids,
+            start_time__gte=min(slot.start for slot in slots),
+            start_time__lte=max(slot.start for slot in slots),
+        )
+        .annotate(attendees=Count("users"))
+        .values_list("pk", "facility_id", "start_time", "end_time", "attendees")
+    )
+    by_key = {(f, s, e): (pk, n) for pk, f, s, e, n in existing}
+    for slot in slots:
+        match = by_key.get((slot.facility_id, slot.start, slot.end))
+        if match:
+            slot.event_id = match[0]
+            slot.needed = max(slot.needed - match[1], 0)
+
+
+def save_roster(slots):
+    """Write new events and attendance rows with bulk inserts"""
+    Attendance = ScheduledEvent.users.through
+    filled = [slot for slot in slots if slot.assigned]
+    new_slots = [slot for slot in filled if slot.event_id is None]
+    topped_up = [slot.event_id for slot in filled if slot.event_id is not None]
+
+    with transaction.atomic():
+        events = ScheduledEvent.objects.bulk_create(
+            [
+                ScheduledEvent(
+                    title=slot.title,
+                    event_type="shift",
+                    start_time=slot.start,
+                    end_time=slot.end,
+                    facility_id=slot.facility_id,
+                    notes="Generated roster",
+                )
+                for slot in new_slots
+            ],
+            batch_size=500,
+        )
+        for slot, event in zip(new_slots, events):
+            slot.event_id = event.pk
+
+        Attendance.objects.bulk_create(
+            [
+                Attendance(scheduledevent_id=slot.event_id, user_id=user_id)
+                for slot in filled
+                for user_id in slot.assigned
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        # Attendance rows don't touch the event, so stamp topped-up events
+        # for delta sync clients
+        if topped_up:
+            ScheduledEvent.objects.filter(pk__in=topped_up).update(
+                updated_at=timezone.now()
+            )
+        transaction.on_commit(
+            partial(
+                bump_feed_versions,
+                {user_id for slot in filled for user_id in slot.assigned},
+                {slot.facility_id for slot in filled},
+            )
+        )
+    return len(new_slots), len(filled) - len(new_slots)
+
+
+def generate_roster(
+    start_date,
+    end_date,
+    facility_ids=None,
+    shift_ids=None,
+    max_weekly_hours=None,
+    min_rest_hours=None,
+    dry_run=False,
+):
+    """Assign staff to every shift slot between start_date and end_date"""
+    if max_weekly_hours is None:
+        max_weekly_hours = settings.ROSTER_MAX_WEEKLY_HOURS
+    min_rest = timedelta(
+        hours=settings.ROSTER_MIN_REST_HOURS if min_rest_hours is None else min_rest_hours
+    )
+
+    facilities = Facility.objects.filter(is_active=True, capacity__gt=0)
+    if facility_ids:
+        facilities = facilities.filter(pk__in=facility_ids)
+    shifts = Shift.objects.filter(is_active=True)
+    if shift_ids:
+        shifts = shifts.filter(pk__in=shift_ids)
+    facilities = list(facilities)
+
+    slots = build_slots(start_date, end_date, facilities, list(shifts))
+    attach_existing_events(slots, [facility.pk for facility in facilities])
+    open_slots = [slot for slot in slots if slot.needed]
+
+    # Look a week either side so rest and weekly limits see adjacent commitments
+    window_start = _aware(start_date - timedelta(days=7), datetime.min.time())
+    window_end = _aware(end_date + timedelta(days=8), datetime.min.time())
+    calendars = load_calendars(start_date, end_date, window_start, window_end)
+
+    assign_greedy(open_slots, calendars, min_rest, max_weekly_hours)
+    rebalance(
+        open_slots,
+        calendars,
+        min_rest,
+        max_weekly_hours,
+        settings.ROSTER_LOCAL_SEARCH_PASSES,
+    )
+
+    created = updated = 0
+    if not dry_run:
+        created, updated = save_roster(open_slots)
+
+    return {
+        "slots": len(slots),
+        "assignments": sum(len(slot.assigned) for slot in open_slots),
+        "unfilled_positions": sum(
+            slot.needed - len(slot.assigned) for slot in open_slots
+        ),
+        "events_created": created,
+        "events_updated": updated,
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,195 @@
+"""
+Bulk schedule operations.
+
+Creating many events and copying a date range of events forward both
+validate references with one query per table and write events and
+attendance rows with bulk_create, so the number of queries does not grow
+with the number of events. Model signals do not fire for bulk writes; the
+calendar feeds they would have refreshed are refreshed here once the write
+commits.
+"""
+
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .feeds import bump_feed_versions
+from .models import Facility, ScheduledEvent
+
+Attendance = ScheduledEvent.users.through
+
+
+def unknown_references(items):
+    """
+    Per-item errors for facility_id and user_ids that do not exist
+
+    Returns a list with an error dict (possibly empty) for each item, or
+    None when every reference exists.
+    """
+    facility_ids = {item["facility_id"] for item in items}
+    user_ids = {user_id for item in items for user_id in item["user_ids"]}
+    facilities = set(
+        Facility.objects.filter(pk__in=facility_ids).values_list("pk", flat=True)
+    )
+    users = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+    if facility_ids <= facilities and user_ids <= users:
+        return None
+
+    errors = []
+    for item in items:
+        error = {}
+        if item["facility_id"] not in facilities:
+            error["facility_id"] = [f"Unknown facility {item['facility_id']}"]
+        missing = [pk for pk in item["user_ids"] if pk not in users]
+        if missing:
+            error["user_ids"] = [f"Unknown users {', '.join(map(str, missing))}"]
+        errors.append(error)
+    return errors
+
+
+def save_events(events):
+    """Insert (event, user ids) pairs; return the events and attendance count"""
+    with transaction.atomic():
+        created = ScheduledEvent.objects.bulk_create(
+            [event for event, _ in events], batch_size=500
+        )
+        attendance = Attendance.objects.bulk_create(
+            [
+                Attendance(scheduledevent_id=event.pk, user_id=user_id)
+                for event, (_, user_ids) in zip(created, events)
+                for user_id in dict.fromkeys(user_ids)
+            ],
+            batch_size=1000,
+        )
+        transaction.on_commit(
+            partial(
+                bump_feed_versions,
+                {row.user_id for row in attendance},
+                {event.facility_id for event in created},
+            )
+        )
+    return created, len(attendance)
+
+
+def create_events(items):
+    """Create events from validated BulkEventSerializer data"""
+    return save_events(
+        [
+            (
+                ScheduledEvent(
+                    title=item["title"],
+                    event_type=item["event_type"],
+                    start_time=item["start_time"],
+                    end_time=item["end_time"],
+                    facility_id=item["facility_id"],
+                    is_recurring=item["is_recurring"],
+                    recurrence_pattern=item["recurrence_pattern"],
+                    notes=item["notes"],
+                ),
+                item["user_ids"],
+            )
+            for item in items
+        ]
+    )
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def shift_days(moment, days):
+    """Move a datetime by whole days, keeping its local wall-clock time"""
+    local = timezone.localtime(moment).replace(tzinfo=None)
+    return timezone.make_aware(local + timedelta(days=days))
+
+
+def copy_events(
+    source_start, source_end, target_start, facility_ids=None, include_users=True
+):
+    """
+    Copy the events starting in an inclusive date range to start at target_start
+
+    Recurring events are left out, since they already repeat. Attendees who
+    are no longer active are dropped. Events that already exist in the
+    target range (same facility, title, type and times) are skipped, so
+    copying the same range twice creates nothing new.
+    """
+    days = (target_start - source_start).days
+    span = (source_end - source_start).days + 1
+
+    source = ScheduledEvent.objects.filter(
+        start_time__gte=_local_midnight(source_start),
+        start_time__lt=_local_midnight(source_end + timedelta(days=1)),
+        is_recurring=False,
+    )
+    if facility_ids:
+        source = source.filter(facility_id__in=facility_ids)
+    source = list(
+        source.order_by("start_time", "pk").values(
+            "pk",
+            "title",
+            "event_type",
+            "start_time",
+            "end_time",
+            "facility_id",
+            "recurrence_pattern",
+            "notes",
+        )
+    )
+
+    attendees = {}
+    if include_users and source:
+        rows = Attendance.objects.filter(
+            scheduledevent_id__in=[event["pk"] for event in source],
+            user__is_active=True,
+        ).values_list("scheduledevent_id", "user_id")
+        for event_id, user_id in rows:
+            attendees.setdefault(event_id, []).append(user_id)
+
+    target = ScheduledEvent.objects.filter(
+        start_time__gte=_local_midnight(target_start),
+        start_time__lt=_local_midnight(target_start + timedelta(days=span)),
+        facility_id__in={event["facility_id"] for event in source},
+    )
+    existing = set(
+        target.values_list("facility_id", "title", "event_type", "start_time", "end_time")
+    )
+
+    events = []
+    for event in source:
+        start_time = shift_days(event["start_time"], days)
+        end_time = shift_days(event["end_time"], days)
+        key = (
+            event["facility_id"],
+            event["title"],
+            event["event_type"],
+            start_time,
+            end_time,
+        )
+        if key in existing:
+            continue
+        existing.add(key)
+        events.append(
+            (
+                ScheduledEvent(
+                    title=event["title"],
+                    event_type=event["event_type"],
+                    start_time=start_time,
+                    end_time=end_time,
+                    facility_id=event["facility_id"],
+                    recurrence_pattern=event["recurrence_pattern"],
+                    notes=event["notes"],
+                ),
+                attendees.get(event["pk"], []),
+            )
+        )
+
+    created, attendance = save_events(events)
+    return {
+        "created": len(created),
+        "skipped": len(source) - len(created),
+        "attendance": attendance,
+    }
@@ -1,4 +1,8 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework import serializers
 
 from .models import (
@@ -13,6 +17,7 @@ from .models import (
     TimeEntry,
     TimeOffRequest,
 )
+from .schedule import unknown_references
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -250,3 +255,100 @@ class TimeOffRequestSerializer(serializers.ModelSerializer):
             "user_id",
             "reviewed_by_id",
         ]
+
+
+class RosterRequestSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    facility_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    shift_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data["end_date"] < data["start_date"]:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        if (data["end_date"] - data["start_date"]).days >= 366:
+            raise serializers.ValidationError("A roster may span at most a year")
+        return data
+
+
+class BulkEventSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200)
+    event_type = serializers.ChoiceField(choices=ScheduledEvent.EVENT_TYPE_CHOICES)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    facility_id = serializers.IntegerField()
+    user_ids = serializers.ListField(child=serializers.IntegerField(), default=list)
+    is_recurring = serializers.BooleanField(default=False)
+    recurrence_pattern = serializers.CharField(
+        max_length=100, allow_blank=True, default=""
+    )
+    notes = serializers.CharField(allow_blank=True, default="")
+
+    def validate(self, data):
+        if data["end_time"] <= data["start_time"]:
+            raise serializers.ValidationError("end_time must be after start_time")
+        return data
+
+
+class BulkEventCreateSerializer(serializers.Serializer):
+    events = BulkEventSerializer(many=True, allow_empty=False)
+
+    def validate_events(self, events):
+        if len(events) > settings.SCHEDULE_BULK_MAX_EVENTS:
+            raise serializers.ValidationError(
+                f"At most {settings.SCHEDULE_BULK_MAX_EVENTS} events per request"
+            )
+        # One query per table for all the events, not one per reference
+        errors = unknown_references(events)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return events
+
+
+class ScheduleCopySerializer(serializers.Serializer):
+    source_start = serializers.DateField()
+    source_end = serializers.DateField()
+    target_start = serializers.DateField()
+    facility_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    include_users = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        if data["source_end"] < data["source_start"]:
+            raise serializers.ValidationError(
+                "source_end must not be before source_start"
+            )
+        span = (data["source_end"] - data["source_start"]).days + 1
+        if span > settings.SCHEDULE_COPY_MAX_DAYS:
+            raise serializers.ValidationError(
+                f"At most {settings.SCHEDULE_COPY_MAX_DAYS} days can be copied at once"
+            )
+        if data["target_start"] == data["source_start"]:
+            raise serializers.ValidationError("target_start must differ from source_start")
+        return data
+
+
+class WeeklyHoursQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(
+        choices=["user", "department", "facility"], default="user"
+    )
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    user_id = serializers.IntegerField(required=False)
+    department = serializers.CharField(required=False, allow_blank=True)
+    facility_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        end_date = data.setdefault("end_date", timezone.localdate())
+        start_date = data.setdefault("start_date", end_date - timedelta(weeks=12))
+        if end_date < start_date:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        if (end_date - start_date).days >= 366:
+            raise serializers.ValidationError("A report may span at most a year")
+        return data
@@ -0,0 +1,144 @@
+"""
+Side-loaded list responses.
+
+List endpoints normally nest related objects in every row, so a user or
+facility referenced by 50 rows is serialized 50 times. With ``?sideload=true``
+rows carry the ids of their related objects instead, and each referenced
+object is serialized once into an ``included`` section keyed by collection
+and id:
+
+    {"count": ..., "results": [{"id": 1, "facility": 3, "users": [5, 8], ...}],
+     "included": {"facilities": {"3": {...}}, "users": {"5": {...}, "8": {...}}}}
+
+Objects in ``included`` are flattened the same way, so a facility's location
+is side-loaded too. Rows and each collection are loaded with one query
+apiece, plus one per to-many relation for its ids.
+
+The nested read-only serializer fields of a serializer decide what is
+side-loaded; nothing has to be declared per endpoint.
+"""
+
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.response import Response
+
+PARAM = "sideload"
+
+# Names of the included collections; other models use their model_name
+COLLECTIONS = {
+    "auth.user": "users",
+    "api.location": "locations",
+    "api.facility": "facilities",
+    "api.incidenttype": "incident_types",
+}
+
+
+def wants_sideload(request):
+    return request.query_params.get(PARAM, "").lower() in ("1", "true", "yes")
+
+
+def collection_name(model):
+    return COLLECTIONS.get(model._meta.label_lower, model._meta.model_name)
+
+
+def nested_fields(serializer_class):
+    """(name, source, child serializer class, many) of nested read-only fields"""
+    nested = []
+    for name, field in serializer_class().fields.items():
+        many = isinstance(field, serializers.ListSerializer)
+        child = field.child if many else field
+        if field.read_only and isinstance(child, serializers.ModelSerializer):
+            nested.append((name, field.source, type(child), many))
+    return nested
+
+
+@lru_cache(maxsize=None)
+def flat_serializer_class(serializer_class):
+    """Subclass of a serializer rendering its nested objects as primary keys"""
+    nested = nested_fields(serializer_class)
+    attrs = {
+        name: serializers.PrimaryKeyRelatedField(
+            read_only=True, many=many, **({"source": source} if source != name else {})
+        )
+        for name, source, _, many in nested
+    }
+    flat = type(f"Sideloaded{serializer_class.__name__}", (serializer_class,), attrs)
+    flat.sideloaded = nested
+    return flat
+
+
+def prefetch_ids(queryset, serializer_class):
+    """Load only the ids of the to-many relations that will be side-loaded"""
+    return queryset.prefetch_related(
+        *[
+            Prefetch(source, queryset=child.Meta.model._base_manager.only("pk"))
+            for _, source, child, many in flat_serializer_class(serializer_class).sideloaded
+            if many
+        ]
+    )
+
+
+def serialize(queryset, serializer_class, context):
+    """Return (rows, included) for the objects of a queryset or list"""
+    flat = flat_serializer_class(serializer_class)
+    rows = flat(queryset, many=True, context=context).data
+    included = build_included(rows, flat, context)
+    return rows, included
+
+
+def _collect(rows, flat, pending):
+    for name, _, child, many in flat.sideloaded:
+        for row in rows:
+            value = row.get(name)
+            if value is None:
+                continue
+            pending[child].update(value if many else [value])
+
+
+def build_included(rows, flat, context):
+    included = {}
+    loaded = defaultdict(set)
+    pending = defaultdict(set)
+    _collect(rows, flat, pending)
+    while pending:
+        child, ids = pending.popitem()
+        model = child.Meta.model
+        key = collection_name(model)
+        ids -= loaded[key]
+        if not ids:
+            continue
+        loaded[key] |= ids
+
+        child_flat = flat_serializer_class(child)
+        objects = prefetch_ids(model._default_manager.filter(pk__in=ids), child)
+        data = child_flat(objects, many=True, context=context).data
+        included.setdefault(key, {}).update((str(item["id"]), item) for item in data)
+        _collect(data, child_flat, pending)
+    return included
+
+
+class SideloadMixin:
+    """ViewSet mixin answering ``list`` in the side-loaded format on request"""
+
+    def list(self, request, *args, **kwargs):
+        if not wants_sideload(request) or "since" in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        serializer_class = self.get_serializer_class()
+        queryset = prefetch_ids(
+            self.filter_queryset(self.get_queryset()), serializer_class
+        )
+        page = self.paginate_queryset(queryset)
+        rows, included = serialize(
+            queryset if page is None else page,
+            serializer_class,
+            self.get_serializer_context(),
+        )
+        if page is None:
+            return Response({"results": rows, "included": included})
+        response = self.get_paginated_response(rows)
+        response.data["included"] = included
+        return response
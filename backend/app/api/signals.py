@@ -0,0 +1,256 @@
+from functools import partial
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .authentication import bump_user_versions
+from .bootstrap import invalidate_reference_sections
+from .counters import apply_ticket_deltas, ticket_key
+from .feeds import bump_feed_versions
+from .history import TRACKED_MODELS, instance_state, record_change, stored_state
+from .models import (
+    Facility,
+    IncidentTicket,
+    IncidentType,
+    Location,
+    Profile,
+    ScheduledEvent,
+    ServiceTicket,
+    Shift,
+    TimeEntry,
+    TimeOffRequest,
+)
+from .notifications import enqueue_on_call_notification, should_notify
+from .reports import mark_stale
+from .sync import record_deletion
+
+# Models served by ?since= delta sync, whose deletions leave tombstones
+SYNCED_MODELS = (
+    IncidentTicket,
+    ServiceTicket,
+    ScheduledEvent,
+    TimeOffRequest,
+    Location,
+    Facility,
+    Shift,
+    IncidentType,
+)
+
+
+@receiver(post_delete, sender=IncidentTicket)
+@receiver(post_delete, sender=ServiceTicket)
+def release_ticket_counters(sender, instance, **kwargs):
+    """Decrement the counters of a deleted ticket inside the delete transaction"""
+    apply_ticket_deltas(sender, [(ticket_key(instance), None)])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Facility)
+@receiver(post_save, sender=Shift)
+@receiver(post_save, sender=IncidentType)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Facility)
+@receiver(post_delete, sender=Shift)
+@receiver(post_delete, sender=IncidentType)
+def invalidate_bootstrap_reference(sender, **kwargs):
+    """Drop cached bootstrap reference sections once the write commits"""
+    transaction.on_commit(partial(invalidate_reference_sections, sender))
+
+
+@receiver(post_save, sender=IncidentTicket)
+def notify_on_call_staff(sender, instance, created, **kwargs):
+    """Queue on-call notifications for a new high-priority incident"""
+    if created and should_notify(instance):
+        transaction.on_commit(partial(enqueue_on_call_notification, instance.pk))
+
+
+@receiver(pre_save, sender=TimeEntry)
+def mark_edited_punch_weeks(sender, instance, **kwargs):
+    """Queue the old and new weeks of an edited punch for the hours reports"""
+    if instance.pk is None:
+        return  # new punches are found from the report high-water mark
+    old = sender.objects.filter(pk=instance.pk).values_list("timestamp", flat=True)
+    mark_stale([*old, instance.timestamp])
+
+
+@receiver(post_delete, sender=TimeEntry)
+def mark_deleted_punch_weeks(sender, instance, **kwargs):
+    mark_stale([instance.timestamp])
+
+
+def bump_feeds_on_commit(user_ids=(), facility_ids=()):
+    transaction.on_commit(
+        partial(bump_feed_versions, set(user_ids), set(facility_ids))
+    )
+
+
+@receiver(pre_save, sender=ScheduledEvent)
+def remember_event_facility(sender, instance, **kwargs):
+    """Keep the facility an edited event had, so its old feed is refreshed too"""
+    instance._feed_facility_ids = {instance.facility_id}
+    if instance.pk is not None:
+        instance._feed_facility_ids.update(
+            sender.objects.filter(pk=instance.pk).values_list("facility_id", flat=True)
+        )
+
+
+@receiver(post_save, sender=ScheduledEvent)
+@receiver(pre_delete, sender=ScheduledEvent)
+def invalidate_event_feeds(sender, instance, **kwargs):
+    """Refresh the calendar feeds of an event's attendees and facilities"""
+    bump_feeds_on_commit(
+        instance.users.values_list("pk", flat=True),
+        getattr(instance, "_feed_facility_ids", {instance.facility_id}),
+    )
+
+
+@receiver(m2m_changed, sender=ScheduledEvent.users.through)
+def invalidate_attendance_feeds(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh the feeds on both sides of added or removed attendance rows"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # user.scheduled_events changed; pk_set holds event ids
+        events = ScheduledEvent.objects.filter(users=instance)
+        if action != "pre_clear":
+            events = ScheduledEvent.objects.filter(pk__in=pk_set)
+        bump_feeds_on_commit([instance.pk], events.values_list("facility_id", flat=True))
+    else:
+        users = instance.users.values_list("pk", flat=True)
+        bump_feeds_on_commit(
+            users if action == "pre_clear" else pk_set, [instance.facility_id]
+        )
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_feed(sender, instance, **kwargs):
+    """Renamed or deactivated users get their feed rebuilt, or refused"""
+    bump_feeds_on_commit(user_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Facility)
+def invalidate_facility_feed(sender, instance, created, **kwargs):
+    """The facility's name also appears in its attendees' feeds"""
+    user_ids = []
+    if not created:
+        user_ids = (
+            User.objects.filter(scheduled_events__facility=instance)
+            .values_list("pk", flat=True)
+            .distinct()
+        )
+    bump_feeds_on_commit(user_ids, [instance.pk])
+
+
+def bump_users_on_commit(user_ids):
+    transaction.on_commit(partial(bump_user_versions, set(user_ids)))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Reload a changed user from the database on its next request"""
+    bump_users_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    bump_users_on_commit([instance.user_id])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reload users whose groups or own permissions changed"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        bump_users_on_commit([instance.pk])
+    elif action == "pre_clear":
+        # group.user_set or permission.user_set is about to be emptied
+        bump_users_on_commit(instance.user_set.values_list("pk", flat=True))
+    else:
+        bump_users_on_commit(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reload the members of groups whose permissions changed"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        groups = [instance.pk]
+    elif action == "pre_clear":
+        # permission.group_set is about to be emptied
+        groups = instance.group_set.values_list("pk", flat=True)
+    else:
+        groups = pk_set
+    bump_users_on_commit(
+        User.objects.filter(groups__in=list(groups)).values_list("pk", flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=Permission)
+def invalidate_permission_holders(sender, instance, **kwargs):
+    """Reload the users who lose a group or permission to its deletion"""
+    if sender is Group:
+        holders = Q(groups=instance)
+    else:
+        holders = Q(user_permissions=instance) | Q(groups__permissions=instance)
+    bump_users_on_commit(User.objects.filter(holders).values_list("pk", flat=True))
+
+
+def remember_stored_state(sender, instance, raw=False, **kwargs):
+    """Read the row as stored before a save, to diff it for the history"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._history_old = None
+    elif "_stored_state" in instance.__dict__:
+        # Already read by CountedTicket.save for the ticket counters
+        instance._history_old = instance.__dict__.pop("_stored_state")
+    else:
+        instance._history_old = stored_state(sender, instance.pk)
+
+
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_history_old", None)
+    record_change(
+        instance, "create" if old is None else "update", old, instance_state(instance)
+    )
+    instance._history_old = None
+
+
+def record_delete(sender, instance, **kwargs):
+    record_change(instance, "delete", instance_state(instance), None)
+
+
+for model in TRACKED_MODELS.values():
+    pre_save.connect(
+        remember_stored_state, sender=model, dispatch_uid=f"history_{model.__name__}"
+    )
+    post_save.connect(record_save, sender=model, dispatch_uid=f"history_{model.__name__}")
+    post_delete.connect(
+        record_delete, sender=model, dispatch_uid=f"history_{model.__name__}"
+    )
+
+
+def record_tombstone(sender, instance, using, **kwargs):
+    """Log the deleted id so delta sync clients can drop it"""
+    record_deletion(sender, instance.pk, using)
+
+
+for model in SYNCED_MODELS:
+    post_delete.connect(
+        record_tombstone, sender=model, dispatch_uid=f"tombstone_{model.__name__}"
+    )
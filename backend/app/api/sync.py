@@ -0,0 +1,186 @@
+"""
+Incremental delta sync for list endpoints.
+
+``GET /api/<resource>/?since=<cursor>`` returns the rows created or updated
+after the cursor, the ids deleted up to the new cursor (from DeletionLog
+tombstones) and that cursor to send next time. ``since=0`` starts a full
+sync.
+
+A cursor is ``<updated_at ISO timestamp>|<pk>``. Pages are ordered by
+(updated_at, pk) so bulk updates that stamp many rows with the same time
+page correctly. The final cursor trails the server clock by
+SYNC_CURSOR_LAG_SECONDS so rows committed by transactions still in flight are
+picked up by the next poll; clients therefore upsert results by id.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from weakref import WeakValueDictionary
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import DeletionLog
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def encode_cursor(updated_at, pk=0):
+    # UTC with a Z suffix keeps "+" out of the cursor, so it is URL-safe as is
+    moment = updated_at.astimezone(dt_timezone.utc)
+    return f"{moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}|{pk}"
+
+
+def decode_cursor(cursor):
+    """Return (updated_at, pk) for a cursor string"""
+    if cursor in ("", "0"):
+        return EPOCH, 0
+    timestamp, _, pk = cursor.partition("|")
+    moment = parse_datetime(timestamp)
+    if moment is None or (pk and not pk.isdigit()):
+        raise InvalidCursor(cursor)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment, int(pk or 0)
+
+
+class _Tombstones:
+    """Tombstones queued in a transaction, inserted together once it commits"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.deleted = defaultdict(dict)  # model -> {pk: deleted_at}
+
+    def add(self, model, pk):
+        self.deleted[model][pk] = timezone.now()
+
+    def __call__(self):
+        if _batches.get(self.connection) is self:
+            del _batches[self.connection]
+        using = self.connection.alias
+        tombstones = []
+        for model, deleted in self.deleted.items():
+            # Rows whose delete was undone by a savepoint rollback still exist
+            restored = set(
+                model._base_manager.using(using)
+                .filter(pk__in=list(deleted))
+                .values_list("pk", flat=True)
+            )
+            tombstones.extend(
+                DeletionLog(model=model_label(model), object_id=pk, deleted_at=at)
+                for pk, at in deleted.items()
+                if pk not in restored
+            )
+        DeletionLog.objects.using(using).bulk_create(tombstones, batch_size=500)
+
+
+# The open batch of each connection. The on_commit queue holds the only strong
+# reference, so a batch leaves this map once it runs or its transaction rolls
+# back and Django discards it.
+_batches = WeakValueDictionary()
+
+
+def record_deletion(model, pk, using=None):
+    """
+    Queue a tombstone for a deleted row
+
+    A cascading delete removes many rows in one transaction; their
+    tombstones are collected and written with one bulk insert on commit.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        DeletionLog.objects.using(connection.alias).create(
+            model=model_label(model), object_id=pk, deleted_at=timezone.now()
+        )
+        return
+    batch = _batches.get(connection)
+    if batch is None:
+        batch = _batches[connection] = _Tombstones(connection)
+        transaction.on_commit(batch, using=connection.alias)
+    batch.add(model, pk)
+
+
+def prune_deletion_log():
+    """Drop tombstones older than the retention window"""
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = DeletionLog.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+class DeltaSyncMixin:
+    """
+    ViewSet mixin answering ``list`` with a delta when ?since= is given
+    """
+
+    def list(self, request, *args, **kwargs):
+        if "since" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            since, since_pk = decode_cursor(request.query_params["since"])
+        except InvalidCursor:
+            return Response(
+                {"error": "Invalid since cursor"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        now = timezone.now()
+        retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        if since != EPOCH and since < now - retention:
+            return Response(
+                {"error": "Cursor has expired, run a full sync with since=0"},
+                status=status.HTTP_410_GONE,
+            )
+
+        limit = settings.SYNC_PAGE_SIZE
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .filter(Q(updated_at__gt=since) | Q(updated_at=since, pk__gt=since_pk))
+            .order_by("updated_at", "pk")
+        )
+        rows = list(queryset[: limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        if has_more:
+            until = rows[-1].updated_at
+            cursor = encode_cursor(until, rows[-1].pk)
+        else:
+            lagged = now - timedelta(seconds=settings.SYNC_CURSOR_LAG_SECONDS)
+            until = max(since, lagged)
+            cursor = encode_cursor(until)
+
+        deleted = []
+        if since != EPOCH:
+            # Deletions are paged by the same cursor as the rows, so each id is
+            # listed on one page only
+            deleted = list(
+                DeletionLog.objects.filter(
+                    model=model_label(queryset.model),
+                    deleted_at__gt=since,
+                    deleted_at__lte=until,
+                )
+                .order_by("deleted_at")
+                .values_list("object_id", flat=True)
+            )
+
+        return Response(
+            {
+                "results": self.get_serializer(rows, many=True).data,
+                "deleted": deleted,
+                "cursor": cursor,
+                "has_more": has_more,
+            }
+        )
@@ -0,0 +1,39 @@
+from celery import shared_task
+from django.utils.dateparse import parse_date
+
+from .notifications import notify_on_call
+from .reports import refresh_weekly_hours
+from .roster import generate_roster
+from .sync import prune_deletion_log
+
+
+@shared_task
+def generate_roster_task(
+    start_date, end_date, facility_ids=None, shift_ids=None, dry_run=False
+):
+    """Generate the shift roster for an inclusive ISO date range"""
+    return generate_roster(
+        parse_date(start_date),
+        parse_date(end_date),
+        facility_ids=facility_ids,
+        shift_ids=shift_ids,
+        dry_run=dry_run,
+    )
+
+
+@shared_task
+def prune_deletion_log_task():
+    """Drop delta sync tombstones older than the retention window"""
+    return prune_deletion_log()
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=5)
+def notify_on_call_task(ticket_id):
+    """Notify the staff on duty about a high-priority incident"""
+    return notify_on_call(ticket_id)
+
+
+@shared_task
+def refresh_weekly_hours_task():
+    """Bring the weekly hours reports up to date with new and edited punches"""
+    return refresh_weekly_hours()
@@ -0,0 +1,181 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api.models import (
+    Facility,
+    HistoryRecord,
+    IncidentTicket,
+    IncidentType,
+    Location,
+    ScheduledEvent,
+    ServiceTicket,
+    TimeEntry,
+    TimeOffRequest,
+)
+from api.pagination import ESTIMATE_THRESHOLD, EstimatedCountPaginator
+
+
+# The manifest storage needs collectstatic before the admin pages can render
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class LargeTableChangelistTests(TestCase):
+    """Changelists of the large-table admins run a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.location = Location.objects.create(name="HQ")
+        cls.facility = Facility.objects.create(name="Studio A", location=cls.location)
+        cls.incident_type = IncidentType.objects.create(name="Outage")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.users = []
+
+    def new_user(self):
+        user = User.objects.create_user(f"user{len(self.users)}")
+        self.users.append(user)
+        return user
+
+    def add_incident_tickets(self, count):
+        for i in range(count):
+            IncidentTicket.objects.create(
+                title=f"Incident {i}",
+                created_by=self.new_user(),
+                assigned_to=self.new_user(),
+                incident_type=self.incident_type,
+                facility=self.facility,
+            )
+
+    def add_service_tickets(self, count):
+        for i in range(count):
+            ServiceTicket.objects.create(
+                title=f"Service {i}",
+                created_by=self.new_user(),
+                assigned_to=self.new_user(),
+                facility=self.facility,
+            )
+
+    def add_time_entries(self, count):
+        for _ in range(count):
+            TimeEntry.objects.create(
+                user=self.new_user(), entry_type="clock_in", location=self.location
+            )
+
+    def add_scheduled_events(self, count):
+        now = timezone.now()
+        for i in range(count):
+            facility = Facility.objects.create(name=f"Room {i}", location=self.location)
+            event = ScheduledEvent.objects.create(
+                title=f"Shift {i}",
+                event_type="shift",
+                start_time=now + timedelta(days=i),
+                end_time=now + timedelta(days=i, hours=8),
+                facility=facility,
+            )
+            event.users.add(self.new_user())
+
+    def add_time_off_requests(self, count):
+        for i in range(count):
+            TimeOffRequest.objects.create(
+                user=self.new_user(),
+                request_type="vacation",
+                start_date=date(2024, 1, 1) + timedelta(days=i),
+                end_date=date(2024, 1, 2) + timedelta(days=i),
+                reason="Trip",
+            )
+
+    def add_history_records(self, count):
+        HistoryRecord.objects.bulk_create(
+            HistoryRecord(
+                model="api.incidentticket",
+                object_id=i,
+                action="update",
+                changes={},
+                changed_by=self.new_user(),
+            )
+            for i in range(count)
+        )
+
+    def assertChangelistQueriesBounded(self, model, add_rows):
+        url = reverse(f"admin:api_{model._meta.model_name}_changelist")
+        add_rows(3)
+        self.assertEqual(self.client.get(url).status_code, 200)  # warm the caches
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        add_rows(20)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 10)
+
+    def test_incident_ticket_changelist(self):
+        self.assertChangelistQueriesBounded(IncidentTicket, self.add_incident_tickets)
+
+    def test_service_ticket_changelist(self):
+        self.assertChangelistQueriesBounded(ServiceTicket, self.add_service_tickets)
+
+    def test_time_entry_changelist(self):
+        self.assertChangelistQueriesBounded(TimeEntry, self.add_time_entries)
+
+    def test_scheduled_event_changelist(self):
+        self.assertChangelistQueriesBounded(ScheduledEvent, self.add_scheduled_events)
+
+    def test_time_off_request_changelist(self):
+        self.assertChangelistQueriesBounded(TimeOffRequest, self.add_time_off_requests)
+
+    def test_history_record_changelist(self):
+        self.assertChangelistQueriesBounded(HistoryRecord, self.add_history_records)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Location.objects.bulk_create(Location(name=f"Site {i}") for i in range(5))
+
+    def fake_postgres(self, estimate):
+        """Patch the paginator's connection to report a pg_class estimate"""
+        fake = mock.MagicMock(vendor="postgresql")
+        cursor = fake.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = None if estimate is None else (estimate,)
+        return mock.patch("api.pagination.connections", {"default": fake})
+
+    def count(self, queryset):
+        return EstimatedCountPaginator(queryset, 10).count
+
+    def test_other_databases_count_exactly(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("runs against the PostgreSQL estimate")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(Location.objects.order_by("pk")), 5)
+
+    def test_large_unfiltered_table_uses_estimate(self):
+        with self.fake_postgres(ESTIMATE_THRESHOLD * 3):
+            self.assertEqual(
+                self.count(Location.objects.order_by("pk")), ESTIMATE_THRESHOLD * 3
+            )
+
+    def test_small_table_falls_back_to_exact_count(self):
+        with self.fake_postgres(ESTIMATE_THRESHOLD - 1):
+            self.assertEqual(self.count(Location.objects.order_by("pk")), 5)
+
+    def test_missing_statistics_fall_back_to_exact_count(self):
+        with self.fake_postgres(None):
+            self.assertEqual(self.count(Location.objects.order_by("pk")), 5)
+
+    def test_filtered_queryset_counts_exactly(self):
+        with self.fake_postgres(ESTIMATE_THRESHOLD * 3) as fake:
+            queryset = Location.objects.filter(name__startswith="Site").order_by("pk")
+            self.assertEqual(self.count(queryset), 5)
+        fake["default"].cursor.assert_not_called()
@@ -0,0 +1,294 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from rest_framework import permissions
+from rest_framework.decorators import permission_classes, throttle_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle
+
+from api import views
+from api.asyncapi import async_api_view
+from api.feeds import sign_feed
+from api.models import Facility, Location, ScheduledEvent
+
+
+class OncePerMinute(AnonRateThrottle):
+    rate = "1/minute"
+
+
+@async_api_view(["GET"])
+@permission_classes([permissions.AllowAny])
+@throttle_classes([OncePerMinute])
+async def throttled_view(request):
+    return Response({"ok": True})
+
+
+@async_api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+async def staff_view(request):
+    return Response({"ok": True})
+
+
+@async_api_view(["POST"])
+@permission_classes([permissions.AllowAny])
+async def failing_view(request):
+    error = request.data.get("error")
+    if error == "validation":
+        raise ValidationError({"name": ["This field is required."]})
+    if error == "missing":
+        raise Http404
+    raise RuntimeError("unexpected")
+
+
+urlpatterns = [
+    path("throttled/", throttled_view),
+    path("staff/", staff_view),
+    path("failing/", failing_view),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncAPIViewTests(TestCase):
+    """async_api_view runs DRF's request checks and error handling"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="pw")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_permission_denied(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/staff/").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_staff = True
+            self.user.save()
+        self.assertEqual(self.client.get("/staff/").status_code, 200)
+
+    async def test_permission_denied_under_asgi(self):
+        response = await self.async_client.get("/staff/")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("detail", response.json())
+
+    def test_throttle(self):
+        self.assertEqual(self.client.get("/throttled/").status_code, 200)
+        response = self.client.get("/throttled/")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    async def test_throttle_under_asgi(self):
+        self.assertEqual((await self.async_client.get("/throttled/")).status_code, 200)
+        response = await self.async_client.get("/throttled/")
+        self.assertEqual(response.status_code, 429)
+
+    async def test_options(self):
+        response = await self.async_client.options("/throttled/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "Throttled View")
+        self.assertEqual(set(response["Allow"].split(", ")), {"GET", "OPTIONS"})
+
+    async def test_method_not_allowed(self):
+        response = await self.async_client.get("/failing/")
+        self.assertEqual(response.status_code, 405)
+        self.assertIn("detail", response.json())
+
+    async def test_exceptions_become_drf_responses(self):
+        response = await self.async_client.post(
+            "/failing/", {"error": "validation"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"name": ["This field is required."]})
+
+        response = await self.async_client.post(
+            "/failing/", {"error": "missing"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("detail", response.json())
+
+    def test_unexpected_exceptions_propagate(self):
+        with self.assertRaises(RuntimeError):
+            self.client.post("/failing/", {}, content_type="application/json")
+
+
+class AuthViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pw")
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    async def test_csrf_token(self):
+        response = await self.async_client.get("/api/csrf/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["csrfToken"])
+
+    async def test_login(self):
+        response = await self.async_client.post(
+            "/api/auth/login/",
+            {"username": "alice", "password": "pw"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], "alice")
+
+    async def test_login_errors(self):
+        response = await self.async_client.post(
+            "/api/auth/login/", {"username": "alice"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(
+            "/api/auth/login/",
+            {"username": "alice", "password": "wrong"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_logout(self):
+        response = await self.async_client.get("/api/auth/user/")
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post("/api/auth/logout/")
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get("/api/auth/user/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_current_user_needs_a_session(self):
+        self.assertEqual(self.client.get("/api/auth/user/").status_code, 403)
+
+    async def test_send_email(self):
+        response = await self.async_client.post(
+            "/api/send-email/",
+            {
+                "subject": "Rota",
+                "message": "Next week's rota is out",
+                "recipient_list": ["bob@example.com"],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["bob@example.com"])
+
+    async def test_send_email_needs_all_fields(self):
+        response = await self.async_client.post(
+            "/api/send-email/", {"subject": "Rota"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(mail.outbox, [])
+
+
+class CalendarFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice")
+        location = Location.objects.create(name="HQ")
+        facility = Facility.objects.create(name="Studio A", location=location)
+        start = timezone.now() + timedelta(days=1)
+        event = ScheduledEvent.objects.create(
+            title="Morning show",
+            event_type="shift",
+            start_time=start,
+            end_time=start + timedelta(hours=4),
+            facility=facility,
+        )
+        event.users.add(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.url = f"/api/calendar/user/{sign_feed('user', self.user.pk)}.ics"
+
+    async def test_feed_streams_under_asgi_then_comes_from_cache(self):
+        with mock.patch.object(
+            views, "_acached_feed", wraps=views._acached_feed
+        ) as acached_feed:
+            response = await self.async_client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        acached_feed.assert_called_once()
+        self.assertIn(b"SUMMARY:Morning show", body)
+
+        response = await self.async_client.get(self.url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, body)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+
+    def test_feed_streams_under_wsgi(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content)
+        self.assertIn(b"SUMMARY:Morning show", body)
+        self.assertEqual(self.client.get(self.url).content, body)
+
+    async def test_unchanged_feed_is_not_modified(self):
+        response = await self.async_client.get(self.url)
+        b"".join([chunk async for chunk in response.streaming_content])
+        response = await self.async_client.get(
+            self.url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_bad_token_is_not_found(self):
+        response = await self.async_client.get(f"{self.url[:-5]}x.ics")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_deactivated_user_is_not_found(self):
+        self.user.is_active = False
+        await sync_to_async(self.user.save)()
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+HEALTHY = {"ok": True, "ms": 1.0}
+FAILED = {"ok": False, "error": "OperationalError: down", "ms": 1.0}
+
+
+class ProbeTests(TestCase):
+    def checks(self, broker=HEALTHY):
+        return mock.patch.multiple(
+            "core.views",
+            check_database=mock.Mock(return_value=HEALTHY),
+            check_cache=mock.Mock(return_value=HEALTHY),
+            check_broker=mock.Mock(return_value=broker),
+        )
+
+    async def test_healthz_checks_no_dependencies(self):
+        with self.checks(broker=FAILED):
+            response = await self.async_client.get("/healthz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok", "checks": {}})
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    async def test_readyz(self):
+        with self.checks():
+            response = await self.async_client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()["checks"]
+        self.assertEqual(set(checks), {"database", "cache", "broker"})
+
+    async def test_readyz_fails_when_a_check_fails(self):
+        with self.checks(broker=FAILED):
+            response = await self.async_client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "unavailable")
+        self.assertEqual(response.json()["checks"]["broker"], FAILED)
+
+    def test_readyz_fails_under_wsgi(self):
+        with self.checks(broker=FAILED):
+            self.assertEqual(self.client.get("/readyz").status_code, 503)
+
+    def test_probes_only_answer_safe_methods(self):
+        self.assertEqual(self.client.head("/healthz").status_code, 200)
+        self.assertEqual(self.client.post("/healthz").status_code, 405)
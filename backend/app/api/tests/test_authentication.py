@@ -0,0 +1,92 @@
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.test import TestCase
+
+from api.authentication import CachedModelBackend
+from api.models import Profile
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.client.force_login(self.user)
+        self.backend = CachedModelBackend()
+
+    def get_current_user(self):
+        return self.client.get("/api/auth/user/")
+
+    def warm(self):
+        self.assertEqual(self.get_current_user().status_code, 200)
+
+    def test_warm_request_runs_no_queries(self):
+        self.warm()
+        with self.assertNumQueries(0):
+            response = self.get_current_user()
+        self.assertEqual(response.json()["username"], "alice")
+
+    def test_cached_user_carries_profile_and_permissions(self):
+        Profile.objects.create(user=self.user, job_title="Engineer", department="Ops")
+        group = Group.objects.create(name="Schedulers")
+        group.permissions.add(Permission.objects.get(codename="add_scheduledevent"))
+        self.user.groups.add(group)
+        cache.clear()
+        self.backend.get_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+            self.assertEqual(user.profile.job_title, "Engineer")
+            self.assertTrue(user.has_perm("api.add_scheduledevent"))
+
+    def test_change_is_picked_up_after_commit(self):
+        self.warm()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.first_name = "Alicia"
+            self.user.save()
+            # Not committed yet, so the cached copy is still served
+            with self.assertNumQueries(0):
+                self.assertEqual(self.backend.get_user(self.user.pk).first_name, "")
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, "Alicia")
+
+    def test_password_change_ends_cached_sessions(self):
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("new password")
+            self.user.save()
+        # The reloaded user's session hash no longer matches the session
+        self.assertEqual(self.get_current_user().status_code, 403)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+        self.assertEqual(self.get_current_user().status_code, 403)
+
+    def test_group_permission_change_reloads_members(self):
+        group = Group.objects.create(name="Schedulers")
+        self.user.groups.add(group)
+        self.assertFalse(
+            self.backend.get_user(self.user.pk).has_perm("api.add_scheduledevent")
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(Permission.objects.get(codename="add_scheduledevent"))
+        self.assertTrue(
+            self.backend.get_user(self.user.pk).has_perm("api.add_scheduledevent")
+        )
+
+    def test_failed_login_hashes_the_password_once(self):
+        encode = PBKDF2PasswordHasher.encode
+        with mock.patch.object(
+            PBKDF2PasswordHasher, "encode", autospec=True, side_effect=encode
+        ) as encode:
+            self.assertIsNone(authenticate(username="alice", password="wrong"))
+        self.assertEqual(encode.call_count, 1)
@@ -0,0 +1,156 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import (
+    Facility,
+    FacilityTicketCounter,
+    HistoryRecord,
+    IncidentTicket,
+    IncidentType,
+    Location,
+)
+
+
+class TicketFixtures:
+    def create_fixtures(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.location = Location.objects.create(name="HQ")
+        self.facility = Facility.objects.create(name="Studio A", location=self.location)
+        self.other_facility = Facility.objects.create(
+            name="Studio B", location=self.location
+        )
+        self.incident_type = IncidentType.objects.create(name="Outage")
+
+    def new_ticket(self, **fields):
+        return IncidentTicket.objects.create(
+            title="Dead air",
+            description="Transmitter down",
+            created_by=self.user,
+            incident_type=self.incident_type,
+            facility=self.facility,
+            **fields,
+        )
+
+
+class TicketHistoryTests(TicketFixtures, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+
+    def test_records_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            ticket = self.new_ticket()
+            self.assertFalse(HistoryRecord.objects.exists())
+        for callback in callbacks:
+            callback()
+
+        record = HistoryRecord.objects.get()
+        self.assertEqual(record.object_id, ticket.pk)
+        self.assertEqual(record.action, "create")
+        self.assertEqual(record.changes["status"], [None, "open"])
+
+    def test_update_records_only_changed_fields(self):
+        ticket = self.new_ticket()
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.status = "resolved"
+            ticket.save()
+
+        record = HistoryRecord.objects.get(action="update")
+        self.assertEqual(record.changes, {"status": ["open", "resolved"]})
+
+    def test_rolled_back_changes_leave_no_history(self):
+        ticket = self.new_ticket()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    ticket.status = "closed"
+                    ticket.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(HistoryRecord.objects.filter(action="update").exists())
+
+    def test_update_reads_the_stored_row_once(self):
+        ticket = self.new_ticket()
+        ticket.status = "resolved"
+        ticket.facility = self.other_facility
+        table = IncidentTicket._meta.db_table
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                ticket.save()
+        reads = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT") and f'FROM "{table}"' in query["sql"]
+        ]
+        self.assertEqual(len(reads), 1)
+
+        # The one read serves both the history and the counters
+        record = HistoryRecord.objects.get(action="update")
+        self.assertEqual(
+            record.changes,
+            {
+                "status": ["open", "resolved"],
+                "facility": [self.facility.pk, self.other_facility.pk],
+            },
+        )
+        counter = FacilityTicketCounter.objects.get(facility=self.facility)
+        self.assertEqual(counter.open_incidents, 0)
+
+
+class RequestHistoryTests(TicketFixtures, TransactionTestCase):
+    """History written by HistoryMiddleware, with real commits"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+        self.client.force_login(self.user)
+
+    def ticket_request(self, **fields):
+        return {
+            "method": "POST",
+            "path": "/api/incident-tickets/",
+            "body": {
+                "title": "Dead air",
+                "description": "Transmitter down",
+                "incident_type_id": self.incident_type.pk,
+                "facility_id": self.facility.pk,
+                "created_by_id": self.user.pk,
+                **fields,
+            },
+        }
+
+    def test_request_records_its_user(self):
+        response = self.client.post(
+            "/api/incident-tickets/",
+            self.ticket_request()["body"],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        record = HistoryRecord.objects.get()
+        self.assertEqual(record.object_id, response.json()["id"])
+        self.assertEqual(record.changed_by, self.user)
+
+    def test_rolled_back_batch_leaves_no_history(self):
+        response = self.client.post(
+            "/api/batch/",
+            json.dumps(
+                {
+                    "atomic": True,
+                    "requests": [
+                        self.ticket_request(),
+                        self.ticket_request(facility_id=0),
+                    ],
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IncidentTicket.objects.exists())
+        self.assertFalse(HistoryRecord.objects.exists())
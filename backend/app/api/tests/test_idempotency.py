@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from api import idempotency
+from api.models import Location
+
+LOCATION = {
+    "name": "HQ",
+    "address": "1 Main St",
+    "city": "Springfield",
+    "state": "IL",
+    "zip_code": "62701",
+}
+
+
+class IdempotentCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create(self, data=LOCATION, key="key-1"):
+        return self.client.post(
+            "/api/locations/",
+            data,
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.create()
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(0):
+            retry = self.create()
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Location.objects.count(), 1)
+
+    def test_other_keys_create_again(self):
+        self.create(key="key-1")
+        self.create(key="key-2")
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_retry_with_a_different_body_is_rejected(self):
+        self.create()
+        response = self.create({**LOCATION, "name": "Annex"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Location.objects.count(), 1)
+
+    def test_failed_requests_are_not_stored(self):
+        self.assertEqual(self.create({"name": "HQ"}).status_code, 400)
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(Location.objects.count(), 1)
+
+    def test_duplicate_in_flight_is_answered_409_without_waiting(self):
+        with mock.patch.object(idempotency, "acquire_lock", return_value=False):
+            response = self.create()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], str(idempotency.RETRY_AFTER))
+        self.assertEqual(Location.objects.count(), 0)
+
+    def test_response_stored_while_waiting_for_the_lock_is_replayed(self):
+        with mock.patch.object(
+            idempotency, "acquire_lock", wraps=idempotency.acquire_lock
+        ) as acquire:
+            first = self.create()
+        lock_key = acquire.call_args.args[0]
+        result_key = lock_key.removesuffix(":lock")
+        stored = cache.get(result_key)
+
+        # The retry misses the stored response, which the first request then
+        # saves just before the retry takes the lock
+        cache.delete(result_key)
+        acquire_lock = idempotency.acquire_lock
+
+        def store_then_acquire(lock_key, token):
+            cache.set(result_key, stored)
+            return acquire_lock(lock_key, token)
+
+        with mock.patch.object(
+            idempotency, "acquire_lock", side_effect=store_then_acquire
+        ):
+            retry = self.create()
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Location.objects.count(), 1)
+
+
+class LockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lock_is_exclusive(self):
+        self.assertTrue(idempotency.acquire_lock("lock", "first"))
+        self.assertFalse(idempotency.acquire_lock("lock", "second"))
+
+    def test_only_the_holder_releases_the_lock(self):
+        idempotency.acquire_lock("lock", "first")
+        idempotency.release_lock("lock", "second")
+        self.assertFalse(idempotency.acquire_lock("lock", "third"))
+
+        idempotency.release_lock("lock", "first")
+        self.assertTrue(idempotency.acquire_lock("lock", "third"))
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import (
+    Location,
+    ReportWatermark,
+    StaleReportWeek,
+    TimeEntry,
+    WeeklyUserHours,
+)
+from api.reports import WATERMARK, refresh_weekly_hours, week_of
+
+
+class WeeklyHoursRefreshTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice")
+        cls.location = Location.objects.create(name="HQ")
+        cls.monday = timezone.make_aware(datetime(2024, 1, 8, 9))
+
+    def punch(self, entry_type, moment, **fields):
+        return TimeEntry.objects.create(
+            user=self.user,
+            entry_type=entry_type,
+            timestamp=moment,
+            location=self.location,
+            **fields,
+        )
+
+    def watermark(self):
+        return ReportWatermark.objects.get(name=WATERMARK)
+
+    def test_idle_refresh_recomputes_nothing(self):
+        self.punch("clock_in", self.monday)
+        self.punch("clock_out", self.monday + timedelta(hours=8))
+        self.assertGreater(refresh_weekly_hours()["weeks"], 0)
+        self.assertEqual(WeeklyUserHours.objects.get().hours, 8)
+
+        self.assertEqual(refresh_weekly_hours()["weeks"], 0)
+
+    def test_late_commit_below_the_mark_is_picked_up(self):
+        first = self.punch("clock_in", self.monday)
+        last = self.punch("clock_in", self.monday + timedelta(days=1), pk=first.pk + 3)
+        refresh_weekly_hours()
+        self.assertEqual(self.watermark().last_id, last.pk)
+        self.assertEqual(self.watermark().pending_ids, [first.pk + 1, first.pk + 2])
+
+        # A transaction that took an id before the mark moved commits late
+        self.punch("clock_out", self.monday + timedelta(hours=8), pk=first.pk + 1)
+        self.assertGreater(refresh_weekly_hours()["weeks"], 0)
+        self.assertEqual(WeeklyUserHours.objects.get().hours, 8)
+        self.assertEqual(self.watermark().pending_ids, [first.pk + 2])
+
+    def test_pending_ids_age_out_of_the_overlap(self):
+        first = self.punch("clock_in", self.monday)
+        self.punch("clock_in", self.monday, pk=first.pk + 2)
+        with self.settings(REPORT_WATERMARK_OVERLAP=2):
+            refresh_weekly_hours()
+            self.assertEqual(self.watermark().pending_ids, [first.pk + 1])
+            self.punch("clock_in", self.monday, pk=first.pk + 3)
+            refresh_weekly_hours()
+        self.assertEqual(self.watermark().pending_ids, [])
+
+    def test_bulk_update_marks_old_and_new_weeks_stale(self):
+        entry = self.punch("clock_in", self.monday)
+        moved = self.monday + timedelta(weeks=3)
+        StaleReportWeek.objects.all().delete()
+
+        TimeEntry.objects.filter(pk=entry.pk).update(timestamp=moved)
+        stale = set(StaleReportWeek.objects.values_list("week", flat=True))
+        self.assertIn(week_of(self.monday), stale)
+        self.assertIn(week_of(moved), stale)
+
+    def test_bulk_update_of_other_fields_marks_nothing(self):
+        entry = self.punch("clock_in", self.monday)
+        StaleReportWeek.objects.all().delete()
+
+        TimeEntry.objects.filter(pk=entry.pk).update(note="Forgot badge")
+        self.assertFalse(StaleReportWeek.objects.exists())
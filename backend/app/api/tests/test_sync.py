@@ -0,0 +1,67 @@
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import DeletionLog, Facility, Location
+
+
+class TombstoneTests(TestCase):
+    def setUp(self):
+        self.locations = [Location.objects.create(name=f"Site {i}") for i in range(3)]
+        self.pks = [location.pk for location in self.locations]
+
+    def tombstones(self):
+        return set(DeletionLog.objects.values_list("object_id", flat=True))
+
+    def test_cascade_is_logged_with_one_insert(self):
+        location = self.locations[0]
+        facility_ids = [
+            Facility.objects.create(name=f"Studio {i}", location=location).pk
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            location.delete()
+            self.assertFalse(DeletionLog.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(DeletionLog.objects.values_list("model", "object_id")),
+            {("api.location", self.pks[0])}
+            | {("api.facility", pk) for pk in facility_ids},
+        )
+
+    def test_rolled_back_savepoint_leaves_no_tombstone(self):
+        kept, restored = self.locations[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.delete()
+            try:
+                with transaction.atomic():
+                    restored.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.tombstones(), {self.pks[0]})
+
+    def test_rolled_back_batch_is_not_reused(self):
+        rolled_back, deleted = self.locations[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    rolled_back.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            deleted.delete()
+        self.assertEqual(self.tombstones(), {self.pks[1]})
+
+    def test_each_commit_gets_its_own_batch(self):
+        first, second = self.locations[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.tombstones(), set(self.pks[:2]))
@@ -0,0 +1,144 @@
+"""
+Token-bucket throttling shared across workers.
+
+Each bucket holds up to N tokens for a rate of ``N/period`` and refills at
+N per period, so clients can burst up to N requests and then settle at the
+configured rate. With Redis behind the default cache a bucket lives in a
+Redis hash updated by a Lua script, which keeps it atomic across gunicorn
+workers and uses the Redis clock. Without Redis (development, tests) buckets
+live in the local cache under a process lock.
+
+Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]:
+
+- ``user``: per authenticated user, or per client IP for anonymous requests
+- ``token``: per credential (Authorization header or session), so one
+  integration cannot use up its owner's whole allowance
+- any other scope: per user on views that set ``throttle_scope``
+
+Throttled requests get DRF's 429 with a Retry-After header. If Redis is
+unreachable the request is let through rather than failed.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.core.cache import cache
+from rest_framework.throttling import (
+    ScopedRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+from core.cache import get_redis_client, make_key
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+_script = None
+_local_lock = threading.Lock()
+
+
+def take_token(key, capacity, refill):
+    """
+    Take one token from the bucket at key
+
+    Returns (allowed, tokens left). refill is in tokens per second.
+    """
+    global _script
+    timeout = math.ceil(capacity / refill) + 1
+
+    client = get_redis_client()
+    if client is not None:
+        if _script is None:
+            _script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, tokens = _script(
+            keys=[make_key(key)], args=[capacity, refill], client=client
+        )
+        return bool(allowed), float(tokens)
+
+    with _local_lock:
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(now - updated, 0) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), timeout)
+    return allowed, tokens
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with a shared token bucket instead of a request log"""
+
+    cache_format = "throttle:bucket:%(scope)s:%(ident)s"
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.refill = self.num_requests / self.duration
+        try:
+            allowed, self.tokens = take_token(
+                self.key, self.num_requests, self.refill
+            )
+        except Exception:
+            logger.exception("Rate limiter unavailable, allowing request")
+            return True
+        return allowed
+
+    def wait(self):
+        return max(1 - self.tokens, 0) / self.refill
+
+
+class UserTokenBucketThrottle(UserRateThrottle, TokenBucketThrottle):
+    """Per user, or per IP address for anonymous requests"""
+
+    # Spelled out so the bucket keys never fall back to the keys of DRF's
+    # request-log throttles, whatever the base class order
+    cache_format = TokenBucketThrottle.cache_format
+
+
+class CredentialTokenBucketThrottle(TokenBucketThrottle):
+    """Per credential: the Authorization header or the session"""
+
+    scope = "token"
+
+    def get_cache_key(self, request, view):
+        credential = request.META.get("HTTP_AUTHORIZATION")
+        if not credential:
+            session = getattr(request._request, "session", None)
+            credential = session.session_key if session is not None else None
+        if not credential:
+            return None
+        ident = hashlib.sha256(credential.encode()).hexdigest()[:32]
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class ScopedTokenBucketThrottle(ScopedRateThrottle, TokenBucketThrottle):
+    """Per user on views with a throttle_scope, e.g. hot polling endpoints"""
+
+    cache_format = TokenBucketThrottle.cache_format  # see UserTokenBucketThrottle
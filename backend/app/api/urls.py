@@ -23,6 +23,33 @@ urlpatterns = [
     path("auth/login/", views.login_view, name="login"),
     path("auth/logout/", views.logout_view, name="logout"),
     path("auth/user/", views.get_current_user, name="current_user"),
+    # Batch endpoint
+    path("batch/", views.batch_view, name="batch"),
+    # Dashboard endpoints
+    path("dashboard/bootstrap/", views.bootstrap_view, name="bootstrap"),
+    path("dashboard/counters/", views.ticket_counters_view, name="ticket_counters"),
+    # Roster endpoint
+    path("roster/generate/", views.generate_roster_view, name="generate_roster"),
+    # Report endpoints
+    path(
+        "reports/weekly-hours/",
+        views.weekly_hours_report_view,
+        name="weekly_hours_report",
+    ),
+    # History endpoint
+    path("history/<str:kind>/<int:pk>/", views.history_view, name="history"),
+    # Calendar feed endpoints
+    path("calendar/feeds/", views.calendar_feeds_view, name="calendar_feeds"),
+    path(
+        "calendar/feeds/rotate/",
+        views.rotate_calendar_feed_view,
+        name="rotate_calendar_feed",
+    ),
+    path(
+        "calendar/<str:scope>/<str:token>.ics",
+        views.calendar_feed_view,
+        name="calendar_feed",
+    ),
     # Email endpoint
     path("send-email/", views.send_email_view, name="send_email"),
     # Include all the ViewSet endpoints
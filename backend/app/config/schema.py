@@ -0,0 +1,104 @@
+"""
+OpenAPI schema and documentation views.
+
+The schema is written to OPENAPI_SCHEMA_DIR at build time by
+``manage.py generate_openapi_schema`` and served from there with an ETag, so
+polling clients never trigger ViewSet and serializer introspection. drf_yasg
+is only imported by workers that actually generate the schema or render one
+of the documentation UIs.
+"""
+
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+SCHEMA_CONTENT_TYPES = {
+    "json": "application/json",
+    "yaml": "application/yaml",
+}
+
+
+def get_api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Broadcast API",
+        default_version="v1",
+        description="API for Broadcast Management System",
+        terms_of_service="https://www.example.com/policies/terms/",
+        contact=openapi.Contact(email="contact@example.com"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+def build_schema(format):
+    """Introspect the API and return the encoded public schema"""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    generator = OpenAPISchemaGenerator(get_api_info())
+    schema = generator.get_schema(request=None, public=True)
+    codec = OpenAPICodecJson if format == "json" else OpenAPICodecYaml
+    return codec(validators=[]).encode(schema)
+
+
+def schema_path(format):
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"swagger.{format}"
+
+
+@lru_cache(maxsize=None)
+def load_schema(format):
+    """
+    Return (content, etag) for the precomputed schema
+
+    Falls back to generating the schema once per worker when the build step
+    has not written it.
+    """
+    path = schema_path(format)
+    content = path.read_bytes() if path.exists() else build_schema(format)
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+@require_safe
+def schema_file_view(request, format):
+    """
+    Serve the precomputed OpenAPI schema, answering revalidations with a 304
+    """
+    if format not in SCHEMA_CONTENT_TYPES:
+        raise Http404
+    content, etag = load_schema(format)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=SCHEMA_CONTENT_TYPES[format])
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+    return response
+
+
+@lru_cache(maxsize=None)
+def _ui_view(renderer):
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    schema_view = get_schema_view(
+        get_api_info(),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+    return schema_view.with_ui(renderer, cache_timeout=0)
+
+
+def swagger_ui_view(request):
+    """Swagger UI, loading its spec from the precomputed schema"""
+    return _ui_view("swagger")(request)
+
+
+def redoc_view(request):
+    """ReDoc, loading its spec from the precomputed schema"""
+    return _ui_view("redoc")(request)
@@ -2,7 +2,9 @@ import os
 from pathlib import Path
 
 import dj_database_url
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
+from kombu import Queue
 
 # Load environment variables from .env file
 load_dotenv()
@@ -40,12 +42,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # Whitenoise for static files
+    "core.middleware.StaticFilesMiddleware",  # Whitenoise for static files
+    "core.middleware.CompressionMiddleware",
+    "core.middleware.LoadSheddingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ProfilingMiddleware",
+    "api.history.HistoryMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -74,9 +80,56 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# How gunicorn serves the app, see gunicorn.conf.py: "wsgi" (sync workers) or
+# "asgi" (uvicorn workers)
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+# Under ASGI every request runs its sync code in a new thread, so persistent
+# connections would pile up one per thread; PgBouncer does the pooling there.
 DATABASES = {
-    "default": dj_database_url.config(default="sqlite:///db.sqlite3", conn_max_age=600)
+    "default": dj_database_url.config(
+        default="sqlite:///db.sqlite3",
+        conn_max_age=int(
+            os.environ.get("DB_CONN_MAX_AGE", 0 if SERVER_MODE == "asgi" else 600)
+        ),
+    )
 }
+# Check persistent connections before reuse, so a database restart costs a
+# reconnect instead of failing the next request on each worker
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+# Server-side cursors do not work through PgBouncer in transaction mode
+DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = (
+    os.environ.get("DB_DISABLE_SERVER_SIDE_CURSORS", "False").lower() == "true"
+)
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"].setdefault("OPTIONS", {})["connect_timeout"] = int(
+        os.environ.get("DB_CONNECT_TIMEOUT", 5)
+    )
+
+# Timeout for the cache and broker round trips made by /healthz and /readyz
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", 2))
+
+# Bearer token accepted by /metrics; staff sessions are accepted as well
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# Cache
+# Redis in deployment (CACHE_URL), per-process memory otherwise
+
+CACHE_URL = os.environ.get("CACHE_URL", "")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
 
 
 # Password validation
@@ -137,8 +190,50 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
+    # Token buckets shared across workers through Redis, see api/throttling.py
+    "DEFAULT_THROTTLE_CLASSES": [
+        "api.throttling.UserTokenBucketThrottle",
+        "api.throttling.CredentialTokenBucketThrottle",
+        "api.throttling.ScopedTokenBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "user": os.environ.get("THROTTLE_RATE_USER", "600/min"),
+        "token": os.environ.get("THROTTLE_RATE_TOKEN", "300/min"),
+        "scheduled_events": os.environ.get("THROTTLE_RATE_SCHEDULED_EVENTS", "60/min"),
+    },
 }
 
+# Load shedding, see core/middleware.py
+# Requests to these path prefixes are answered with 503 under overload so
+# clock-ins and incident creation keep a worker. The in-flight limit counts
+# requests across all workers and defaults to one less than the 4 production
+# gunicorn workers, or under ASGI to three quarters of the 4 x 40 concurrent
+# requests the uvicorn workers admit.
+LOAD_SHED_ENABLED = os.environ.get("LOAD_SHED_ENABLED", "True").lower() == "true"
+LOAD_SHED_PATHS = os.environ.get(
+    "LOAD_SHED_PATHS",
+    "/api/scheduled-events/,/api/time-off-requests/,/api/dashboard/,/api/batch/,"
+    "/api/roster/,/swagger,/redoc",
+).split(",")
+# Requests to these prefixes skip in-flight tracking and its two Redis round
+# trips: they are cheap, and health probes must answer during overload
+LOAD_SHED_EXEMPT_PATHS = os.environ.get(
+    "LOAD_SHED_EXEMPT_PATHS", "/healthz,/readyz,/metrics,/static/,/media/"
+).split(",")
+LOAD_SHED_MAX_IN_FLIGHT = int(
+    os.environ.get("LOAD_SHED_MAX_IN_FLIGHT", 120 if SERVER_MODE == "asgi" else 3)
+)
+LOAD_SHED_MAX_DB_LATENCY_MS = float(os.environ.get("LOAD_SHED_MAX_DB_LATENCY_MS", 250))
+LOAD_SHED_PROBE_INTERVAL = float(os.environ.get("LOAD_SHED_PROBE_INTERVAL", 5))
+LOAD_SHED_RETRY_AFTER = int(os.environ.get("LOAD_SHED_RETRY_AFTER", 10))
+LOAD_SHED_STALE_SECONDS = int(os.environ.get("LOAD_SHED_STALE_SECONDS", 120))
+
+# Response compression, see core/middleware.py
+# JSON responses smaller than COMPRESS_MIN_SIZE bytes are sent as is. Brotli
+# quality 5 compresses about as fast as gzip level 6 but smaller.
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.environ.get(
     "CORS_ALLOWED_ORIGINS",
@@ -146,6 +241,8 @@ CORS_ALLOWED_ORIGINS = os.environ.get(
 ).split(",")
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed"]
 
 CSRF_TRUSTED_ORIGINS = os.environ.get(
     "CSRF_TRUSTED_ORIGINS",
@@ -153,8 +250,19 @@ CSRF_TRUSTED_ORIGINS = os.environ.get(
 ).split(",")
 
 # Session settings
+# Sessions are read from the cache and written to both the cache and the
+# database, and the user of a session is cached as well (api/authentication.py),
+# so authenticated requests reach their view without a query.
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE", "django.contrib.sessions.backends.cached_db"
+)
 SESSION_COOKIE_SECURE = not DEBUG
 SESSION_COOKIE_SAMESITE = "Lax"
+AUTHENTICATION_BACKENDS = [
+    "api.authentication.CachedModelBackend",
+    "django.contrib.auth.backends.ModelBackend",  # sessions from before the cache
+]
+USER_CACHE_TIMEOUT = int(os.environ.get("USER_CACHE_TIMEOUT", 3600))
 
 # Celery settings
 CELERY_BROKER_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
@@ -163,6 +271,126 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+# Separate queues keep slow batch work from delaying urgent notifications;
+# each queue gets its own worker pool (see docker-compose.prod.yml). Tasks
+# not routed below go to the default queue.
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_QUEUES = (
+    Queue("realtime"),
+    Queue("email"),
+    Queue("default"),
+    Queue("batch"),
+)
+CELERY_TASK_ROUTES = {
+    "api.tasks.notify_on_call_task": {"queue": "realtime"},
+    "api.tasks.send_*": {"queue": "email"},
+    "api.tasks.generate_roster_task": {"queue": "batch"},
+    "api.tasks.refresh_weekly_hours_task": {"queue": "batch"},
+    "api.tasks.prune_deletion_log_task": {"queue": "batch"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "prune-deletion-log": {
+        "task": "api.tasks.prune_deletion_log_task",
+        "schedule": 24 * 60 * 60,
+    },
+    "refresh-weekly-hours": {
+        "task": "api.tasks.refresh_weekly_hours_task",
+        "schedule": int(os.environ.get("REPORT_REFRESH_INTERVAL", 15 * 60)),
+    },
+}
+
+# OpenAPI schema
+# Written by `manage.py generate_openapi_schema` at build time and served
+# from disk; the documentation UIs load their spec from it
+OPENAPI_SCHEMA_DIR = os.environ.get(
+    "OPENAPI_SCHEMA_DIR", os.path.join(BASE_DIR, "openapi")
+)
+OPENAPI_SCHEMA_MAX_AGE = int(os.environ.get("OPENAPI_SCHEMA_MAX_AGE", 300))
+
+SWAGGER_SETTINGS = {
+    "SPEC_URL": ("schema-json", {"format": "json"}),
+}
+REDOC_SETTINGS = {
+    "SPEC_URL": ("schema-json", {"format": "json"}),
+}
+
+# Maximum number of sub-requests accepted by /api/batch/
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+
+# Sampled request profiling, see core/profiling.py
+# PROFILING_VIEWS overrides the sample rate per URL name, given as
+# "name:rate,name:rate" (e.g. "scheduledevent-list:0.2"). Staff users can
+# profile any single request by sending the PROFILING_HEADER header.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "False").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_VIEWS = {
+    name: float(rate)
+    for name, _, rate in (
+        item.partition(":")
+        for item in os.environ.get("PROFILING_VIEWS", "").split(",")
+        if item
+    )
+}
+PROFILING_HEADER = "X-Profile"
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILING_MAX_SAMPLES = int(os.environ.get("PROFILING_MAX_SAMPLES", 500))
+
+# Idempotency-Key support on create endpoints
+# Stored responses are replayed to retries for IDEMPOTENCY_KEY_TTL seconds.
+# A duplicate arriving while the first request runs is answered 409 with
+# Retry-After; the lock is dropped after IDEMPOTENCY_LOCK_TIMEOUT seconds.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", 30))
+
+# Dashboard settings
+# How long cached reference sections (locations, facilities, shifts,
+# incident types) of the bootstrap endpoint live; writes invalidate them
+BOOTSTRAP_REFERENCE_TIMEOUT = int(os.environ.get("BOOTSTRAP_REFERENCE_TIMEOUT", 3600))
+BOOTSTRAP_TICKET_LIMIT = int(os.environ.get("BOOTSTRAP_TICKET_LIMIT", 50))
+BOOTSTRAP_SCHEDULE_DAYS = int(os.environ.get("BOOTSTRAP_SCHEDULE_DAYS", 14))
+
+# Delta sync (?since= on list endpoints)
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", 500))
+# How far the returned cursor trails the clock, to cover in-flight transactions
+SYNC_CURSOR_LAG_SECONDS = int(os.environ.get("SYNC_CURSOR_LAG_SECONDS", 5))
+# Tombstones are kept this long; older cursors must resync from scratch
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get("SYNC_TOMBSTONE_RETENTION_DAYS", 30))
+
+# On-call notifications for high-priority incidents, see api/notifications.py
+# Incident types at or above this priority_level (3 = High) notify the staff
+# on duty at the ticket's facility
+ONCALL_NOTIFY_MIN_PRIORITY = int(os.environ.get("ONCALL_NOTIFY_MIN_PRIORITY", 3))
+ONCALL_EVENT_TYPES = ("shift", "overtime")
+# Longest event considered when looking up who is on duty
+ONCALL_MAX_EVENT_HOURS = int(os.environ.get("ONCALL_MAX_EVENT_HOURS", 24))
+ONCALL_NOTIFICATION_CHANNELS = ["api.notifications.EmailChannel"]
+ONCALL_NOTIFICATION_BATCH_SIZE = int(os.environ.get("ONCALL_NOTIFICATION_BATCH_SIZE", 50))
+ONCALL_NOTIFICATION_LOCK_TIMEOUT = 300
+ONCALL_DEDUPE_TTL = 60 * 60 * 24
+
+# Weekly hours reports, see api/reports.py
+# Punch pairs further apart than this are treated as a missed clock-out
+REPORT_MAX_SHIFT_HOURS = int(os.environ.get("REPORT_MAX_SHIFT_HOURS", 16))
+# How far below the high-water mark missing time entry ids are looked up again
+# on each refresh, to catch transactions that commit out of id order
+REPORT_WATERMARK_OVERLAP = int(os.environ.get("REPORT_WATERMARK_OVERLAP", 1000))
+
+# iCalendar feeds of scheduled events, see api/feeds.py
+CALENDAR_FEED_PAST_DAYS = int(os.environ.get("CALENDAR_FEED_PAST_DAYS", 30))
+CALENDAR_FEED_FUTURE_DAYS = int(os.environ.get("CALENDAR_FEED_FUTURE_DAYS", 180))
+# How long calendar clients may reuse a feed before polling again
+CALENDAR_FEED_MAX_AGE = int(os.environ.get("CALENDAR_FEED_MAX_AGE", 300))
+# Rendered feeds are cached until an event in them changes or the day ends
+CALENDAR_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bulk schedule operations, see api/schedule.py
+SCHEDULE_BULK_MAX_EVENTS = int(os.environ.get("SCHEDULE_BULK_MAX_EVENTS", 1000))
+SCHEDULE_COPY_MAX_DAYS = int(os.environ.get("SCHEDULE_COPY_MAX_DAYS", 31))
+
+# Roster generation
+ROSTER_MAX_WEEKLY_HOURS = float(os.environ.get("ROSTER_MAX_WEEKLY_HOURS", 40))
+ROSTER_MIN_REST_HOURS = float(os.environ.get("ROSTER_MIN_REST_HOURS", 11))
+ROSTER_LOCAL_SEARCH_PASSES = int(os.environ.get("ROSTER_LOCAL_SEARCH_PASSES", 2))
 
 # Email settings
 EMAIL_BACKEND = os.environ.get(
@@ -1,36 +1,24 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
+from django.urls import include, path, re_path
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Broadcast API",
-        default_version="v1",
-        description="API for Broadcast Management System",
-        terms_of_service="https://www.example.com/policies/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from core.views import healthz, metrics, readyz
+
+from .schema import redoc_view, schema_file_view, swagger_ui_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    # API Documentation
-    path(
-        "swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"
-    ),
-    path(
-        "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
+    # Health probes
+    path("healthz", healthz, name="healthz"),
+    path("readyz", readyz, name="readyz"),
+    path("metrics", metrics, name="metrics"),
+    # API Documentation, served from the schema precomputed at build time
+    re_path(
+        r"^swagger\.(?P<format>json|yaml)/?$", schema_file_view, name="schema-json"
     ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("swagger/", swagger_ui_view, name="schema-swagger-ui"),
+    path("redoc/", redoc_view, name="schema-redoc"),
     # API endpoints
     path("api/", include("api.urls")),
 ]
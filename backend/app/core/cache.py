@@ -0,0 +1,22 @@
+"""
+Access to the Redis server behind the default cache.
+
+Rate limiting and load shedding need atomic operations that the Django cache
+API does not offer, so they talk to Redis directly when the default cache is
+RedisCache and fall back to per-process state otherwise.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+def get_redis_client(write=True):
+    """Return a redis client for the default cache, or None without Redis"""
+    backend = caches['default']
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(write=write)
+
+
+def make_key(key):
+    """Apply the cache's KEY_PREFIX and VERSION to a raw Redis key"""
+    return caches['default'].make_key(key)
@@ -0,0 +1,74 @@
+"""
+Dependency checks shared by the health endpoints, wait_for_db and the
+gunicorn worker warm-up.
+
+Each check performs a real round trip and returns a dict with ``ok`` and the
+round-trip time in milliseconds, plus an ``error`` on failure.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+def _timed(check):
+    started = time.monotonic()
+    try:
+        check()
+    except Exception as e:
+        result = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+    else:
+        result = {'ok': True}
+    result['ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+def ping_database(alias='default'):
+    """Run SELECT 1, discarding a connection that turns out to be broken"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception:
+        connection.close_if_unusable_or_obsolete()
+        raise
+
+
+def ping_cache():
+    key = f'health:{uuid.uuid4().hex}'
+    cache.set(key, 1, 5)
+    if cache.get(key) != 1:
+        raise RuntimeError('cache did not return the value just written')
+    cache.delete(key)
+
+
+def ping_broker():
+    from config.celery import app
+
+    with app.connection_for_write() as connection:
+        connection.ensure_connection(
+            max_retries=1, timeout=settings.HEALTH_CHECK_TIMEOUT
+        )
+        client = getattr(connection.default_channel, 'client', None)
+        if hasattr(client, 'ping'):
+            client.ping()
+
+
+def check_database():
+    return _timed(ping_database)
+
+
+def check_cache():
+    return _timed(ping_cache)
+
+
+def check_broker():
+    return _timed(ping_broker)
+
+
+def warm_up():
+    """Open the database connection and touch the cache before serving"""
+    return {'database': check_database(), 'cache': check_cache()}
@@ -0,0 +1,92 @@
+import pstats
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.profiling import load_samples, normalize_sql
+
+
+class Command(BaseCommand):
+    """Django command to summarize sampled request profiles per view"""
+
+    help = 'Report the hottest functions and queries per view from sampled profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            default=settings.PROFILING_DIR,
+            help='Directory holding the samples (default: PROFILING_DIR)',
+        )
+        parser.add_argument('--view', help='Only report this URL name')
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Functions and queries listed per view (default: 15)',
+        )
+        parser.add_argument(
+            '--hours',
+            type=float,
+            help='Only use samples from the last N hours',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['hours']:
+            since = timezone.now() - timedelta(hours=options['hours'])
+
+        views = defaultdict(list)
+        for metadata, prof in load_samples(options['dir'], since):
+            if options['view'] and metadata['view'] != options['view']:
+                continue
+            views[metadata['view']].append((metadata, prof))
+        if not views:
+            raise CommandError(f"No profiles found in {options['dir']}")
+
+        # Slowest views first
+        for view, samples in sorted(
+            views.items(),
+            key=lambda item: -sum(m['ms'] for m, _ in item[1]) / len(item[1]),
+        ):
+            self.report(view, samples, options['top'])
+
+    def report(self, view, samples, top):
+        durations = sorted(metadata['ms'] for metadata, _ in samples)
+        p95 = durations[min(int(len(durations) * 0.95), len(durations) - 1)]
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f'{view}: {len(samples)} samples, '
+                f'mean {sum(durations) / len(durations):.1f}ms, p95 {p95:.1f}ms'
+            )
+        )
+
+        stats = pstats.Stats(str(samples[0][1]))
+        for _, prof in samples[1:]:
+            stats.add(str(prof))
+        functions = sorted(
+            stats.stats.items(), key=lambda item: item[1][2], reverse=True
+        )[:top]
+        self.stdout.write('  Hot functions (own time, cumulative time, calls):')
+        for (filename, line, name), (_, calls, own, cumulative, _) in functions:
+            self.stdout.write(
+                f'    {own * 1000:9.1f}ms {cumulative * 1000:9.1f}ms '
+                f'{calls:8d}  {name} ({filename}:{line})'
+            )
+
+        queries = defaultdict(lambda: [0, 0.0])
+        for metadata, _ in samples:
+            for query in metadata['queries']:
+                totals = queries[normalize_sql(query['sql'])]
+                totals[0] += 1
+                totals[1] += query['ms']
+        self.stdout.write('  Hot queries (total time, count per request):')
+        for sql, (count, total) in sorted(
+            queries.items(), key=lambda item: item[1][1], reverse=True
+        )[:top]:
+            self.stdout.write(
+                f'    {total:9.1f}ms {count / len(samples):8.1f}  {sql[:200]}'
+            )
+        self.stdout.write('')
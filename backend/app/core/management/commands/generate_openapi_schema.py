@@ -0,0 +1,25 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.schema import SCHEMA_CONTENT_TYPES, build_schema, schema_path
+
+
+class Command(BaseCommand):
+    """Django command to precompute the OpenAPI schema served by the docs"""
+
+    help = 'Write the OpenAPI schema to OPENAPI_SCHEMA_DIR'
+
+    def handle(self, *args, **options):
+        os.makedirs(settings.OPENAPI_SCHEMA_DIR, exist_ok=True)
+        for format in SCHEMA_CONTENT_TYPES:
+            path = schema_path(format)
+            content = build_schema(format)
+            # Write then rename so running workers never read a partial file
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+            self.stdout.write(f'Wrote {path} ({len(content)} bytes)')
+
+        self.stdout.write(self.style.SUCCESS('OpenAPI schema generated'))
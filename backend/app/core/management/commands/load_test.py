@@ -0,0 +1,140 @@
+import http.client
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(durations, fraction):
+    return durations[min(int(len(durations) * fraction), len(durations) - 1)]
+
+
+class Client(threading.local):
+    """One keep-alive connection per load thread"""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, body, headers):
+        if self.connection is None:
+            connection_class = (
+                http.client.HTTPSConnection
+                if self.url.scheme == 'https'
+                else http.client.HTTPConnection
+            )
+            self.connection = connection_class(self.url.netloc, timeout=self.timeout)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except Exception:
+            self.connection.close()
+            self.connection = None
+            raise
+
+
+class Command(BaseCommand):
+    """Django command to measure throughput and latency of an endpoint under load"""
+
+    help = (
+        'Send requests to a running server from many concurrent connections and '
+        'report throughput and latency percentiles, e.g. to compare the WSGI '
+        'and ASGI serving modes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Full URL, e.g. http://127.0.0.1:8000/healthz')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Requests kept in flight at once (default: 50)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Total number of requests (default: 1000)',
+        )
+        parser.add_argument('--method', default='GET', help='HTTP method (default: GET)')
+        parser.add_argument('--data', help='Request body, e.g. a JSON document')
+        parser.add_argument(
+            '--header',
+            action='append',
+            default=[],
+            help='Extra header as "Name: value"; repeat for more',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Seconds to wait for each response (default: 30)',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.netloc:
+            raise CommandError(f"Not an http(s) URL: {options['url']}")
+        path = url.path or '/'
+        if url.query:
+            path += f'?{url.query}'
+
+        headers = {}
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError(f'Header must look like "Name: value": {header}')
+            headers[name.strip()] = value.strip()
+        body = options['data'].encode() if options['data'] else None
+        if body is not None:
+            headers.setdefault('Content-Type', 'application/json')
+
+        client = Client(url, options['timeout'])
+        statuses = Counter()
+        durations = []
+        lock = threading.Lock()
+
+        def send(_):
+            started = time.perf_counter()
+            try:
+                outcome = client.request(options['method'], path, body, headers)
+            except Exception as e:
+                outcome = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                statuses[outcome] += 1
+                durations.append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for _ in pool.map(send, range(options['requests'])):
+                pass
+        wall = time.perf_counter() - started
+
+        durations.sort()
+        ok = sum(count for status, count in statuses.items() if status in range(200, 400))
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}, "
+            f'{wall:.2f}s'
+        )
+        responses = sorted(statuses.items(), key=lambda item: str(item[0]))
+        self.stdout.write(
+            '  responses: '
+            + ', '.join(f'{status}: {count}' for status, count in responses)
+        )
+        self.stdout.write(f'  throughput: {ok / wall:.1f} successful req/s')
+        self.stdout.write(
+            f'  latency ms: mean {sum(durations) / len(durations):.1f}, '
+            f'p50 {_percentile(durations, 0.5):.1f}, '
+            f'p95 {_percentile(durations, 0.95):.1f}, '
+            f'p99 {_percentile(durations, 0.99):.1f}, '
+            f'max {durations[-1]:.1f}'
+        )
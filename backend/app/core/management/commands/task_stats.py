@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+
+from core import taskmetrics
+
+
+def _seconds(value):
+    if value is None:
+        return '-'
+    if value == float('inf'):
+        return f'>{taskmetrics.BUCKETS[-2]}s'
+    return f'{value:.2f}s'
+
+
+class Command(BaseCommand):
+    """Django command to report Celery queue depths and the slowest tasks"""
+
+    help = 'Show how many messages wait in each Celery queue and which tasks are slowest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Task types listed, slowest first by mean runtime (default: 10)',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Clear the task counters after reporting them',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING('Queue depths:'))
+        try:
+            depths = taskmetrics.queue_depths()
+        except Exception as e:
+            self.stderr.write(f'  Could not reach the broker: {e}')
+        else:
+            for queue, depth in depths.items():
+                self.stdout.write(f'  {queue:<12} {depth:8d}')
+
+        tasks = sorted(
+            (
+                (name, taskmetrics.summarize(fields))
+                for name, fields in taskmetrics.snapshot().items()
+            ),
+            key=lambda item: item[1]['mean_runtime'] or 0,
+            reverse=True,
+        )[: options['top']]
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest tasks:'))
+        if not tasks:
+            self.stdout.write('  No task runs recorded yet')
+        else:
+            self.stdout.write(
+                f"  {'mean run':>9} {'p95 run':>9} {'mean wait':>9} {'p95 wait':>9} "
+                f"{'runs':>7} {'failed':>7} {'retried':>7}  task"
+            )
+        for name, stats in tasks:
+            self.stdout.write(
+                f"  {_seconds(stats['mean_runtime']):>9} "
+                f"{_seconds(stats['p95_runtime']):>9} "
+                f"{_seconds(stats['mean_wait']):>9} "
+                f"{_seconds(stats['p95_wait']):>9} "
+                f"{stats['runs']:7d} {stats['failed']:7d} {stats['retried']:7d}  {name}"
+            )
+
+        if options['reset']:
+            taskmetrics.reset()
+            self.stdout.write(self.style.SUCCESS('Task counters cleared'))
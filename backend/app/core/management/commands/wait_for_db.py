@@ -1,20 +1,44 @@
 import time
-from django.db import connections
-from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.health import ping_database
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Seconds to keep trying before giving up (default: 60)',
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=5,
+            help='Longest wait between attempts in seconds (default: 5)',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options['timeout']
+        delay = 0.25
+
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                ping_database()
+            except Exception as e:
+                if time.monotonic() + delay > deadline:
+                    raise CommandError(f'Database unavailable: {e}')
+                self.stdout.write(
+                    f'Database unavailable ({e}), retrying in {delay:g} seconds...'
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
+            else:
+                break
 
         self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,362 @@
+"""
+Request middleware: response compression, load shedding and sampled profiling.
+
+Compression
+-----------
+
+CompressionMiddleware compresses JSON responses of at least
+COMPRESS_MIN_SIZE bytes with brotli when the client accepts it and the
+brotli package is installed, else with gzip. Only JSON is compressed, and
+small responses never are, which keeps short secrets like the CSRF token
+endpoint's out of compressed bodies (BREACH).
+
+Load shedding
+-------------
+
+Under overload, requests to the path prefixes in LOAD_SHED_PATHS are
+answered with 503 and a Retry-After header before they reach a view, so the
+workers stay free for clock-ins, incident creation and everything else that
+is not listed. The server counts as overloaded when either
+
+- LOAD_SHED_MAX_IN_FLIGHT or more other requests are in flight across all
+  workers (tracked in a Redis sorted set, or per process without Redis), or
+- the last SELECT 1 probe, repeated every LOAD_SHED_PROBE_INTERVAL seconds
+  per worker, took longer than LOAD_SHED_MAX_DB_LATENCY_MS.
+
+Entries left behind by killed workers expire after LOAD_SHED_STALE_SECONDS.
+Failures of the tracking itself never reject a request.
+
+Profiling
+---------
+ProfilingMiddleware samples requests for cProfile and query logging, see
+core.profiling.
+"""
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+
+from asgiref.sync import (
+    async_to_sync,
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+from .cache import get_redis_client, make_key
+from .health import ping_database
+from .profiling import (
+    QueryLog,
+    is_requested,
+    profile_connections,
+    sample_rate,
+    save_sample,
+    view_name,
+)
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_KEY = 'loadshed:inflight'
+UNTRACKED = object()  # token of a request the tracker could not register
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs in both modes
+
+    Django calls __call__ from the event loop when the next handler is
+    async, so ASGI requests stay async through the stack instead of
+    switching threads at every sync-only layer. Subclasses implement
+    __call__ for WSGI and __acall__ for ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class StaticFilesMiddleware(AsyncCapableMiddleware, WhiteNoiseMiddleware):
+    """WhiteNoise, which only comes as sync middleware, usable under ASGI"""
+
+    def __init__(self, get_response):
+        WhiteNoiseMiddleware.__init__(self, get_response)
+        AsyncCapableMiddleware.__init__(self, get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class CompressionMiddleware(AsyncCapableMiddleware):
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESS_MIN_SIZE:
+            return response
+
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and ACCEPTS_BROTLI.search(accepted):
+            encoding = 'br'
+            content = brotli.compress(
+                response.content,
+                mode=brotli.MODE_TEXT,
+                quality=settings.COMPRESS_BROTLI_QUALITY,
+            )
+        elif ACCEPTS_GZIP.search(accepted):
+            encoding = 'gzip'
+            content = compress_string(response.content, max_random_bytes=100)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The body changed, so a strong ETag must become weak (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class InFlightTracker:
+    """Count the requests currently running across all workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local_count = 0
+
+    def enter(self):
+        """Register a request; return (token, number of other requests)"""
+        client = get_redis_client()
+        if client is None:
+            with self.lock:
+                self.local_count += 1
+                return None, self.local_count - 1
+
+        token = uuid.uuid4().hex
+        key = make_key(IN_FLIGHT_KEY)
+        now = time.time()
+        stale = settings.LOAD_SHED_STALE_SECONDS
+        pipe = client.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now - stale)
+        pipe.zadd(key, {token: now})
+        pipe.zcard(key)
+        pipe.expire(key, stale)
+        count = pipe.execute()[2]
+        return token, count - 1
+
+    def leave(self, token):
+        if token is None:
+            with self.lock:
+                self.local_count -= 1
+            return
+        get_redis_client().zrem(make_key(IN_FLIGHT_KEY), token)
+
+
+class DatabaseLatencyProbe:
+    """Time SELECT 1 at most once per interval and remember the result"""
+
+    def __init__(self):
+        self.latency_ms = 0.0
+        self.checked_at = float('-inf')
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked_at >= settings.LOAD_SHED_PROBE_INTERVAL:
+            self.checked_at = now
+            try:
+                ping_database()
+            except Exception:
+                # The database being down is not an overload; let the view fail
+                self.latency_ms = 0.0
+            else:
+                self.latency_ms = (time.monotonic() - now) * 1000
+        return self.latency_ms
+
+
+class LoadSheddingMiddleware(AsyncCapableMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.in_flight = InFlightTracker()
+        self.db_latency = DatabaseLatencyProbe()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.LOAD_SHED_ENABLED or self.is_exempt(request):
+            return self.get_response(request)
+        token, rejection = self.admit(request)
+        try:
+            if rejection is not None:
+                return rejection
+            return self.get_response(request)
+        finally:
+            self.release(token)
+
+    async def __acall__(self, request):
+        if not settings.LOAD_SHED_ENABLED or self.is_exempt(request):
+            return await self.get_response(request)
+        # Redis and the database probe block, so they run in the request's thread
+        token, rejection = await sync_to_async(self.admit)(request)
+        try:
+            if rejection is not None:
+                return rejection
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(self.release)(token)
+
+    def admit(self, request):
+        """Register a request; return its token and a 503 response or None"""
+        try:
+            token, others = self.in_flight.enter()
+        except Exception:
+            logger.exception('In-flight tracking unavailable')
+            return UNTRACKED, None
+        if self.is_low_priority(request):
+            reason = self.overload_reason(others)
+            if reason:
+                return token, self.shed(reason)
+        return token, None
+
+    def release(self, token):
+        if token is UNTRACKED:
+            return
+        try:
+            self.in_flight.leave(token)
+        except Exception:
+            logger.exception('In-flight tracking unavailable')
+
+    def is_exempt(self, request):
+        """Probes and static files are neither counted nor shed, saving Redis"""
+        return request.path.startswith(tuple(settings.LOAD_SHED_EXEMPT_PATHS))
+
+    def is_low_priority(self, request):
+        return request.path.startswith(tuple(settings.LOAD_SHED_PATHS))
+
+    def overload_reason(self, others):
+        if others >= settings.LOAD_SHED_MAX_IN_FLIGHT:
+            return f'{others} requests in flight'
+        latency = self.db_latency.current()
+        if latency > settings.LOAD_SHED_MAX_DB_LATENCY_MS:
+            return f'database latency {latency:.0f}ms'
+        return None
+
+    def shed(self, reason):
+        logger.warning('Shedding low-priority request: %s', reason)
+        response = JsonResponse(
+            {'error': 'Server is busy, retry later'}, status=503
+        )
+        response['Retry-After'] = str(settings.LOAD_SHED_RETRY_AFTER)
+        return response
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        name = self.profiled_view(request) if self.may_profile(request) else None
+        if name is None:
+            return self.get_response(request)
+        return self.profile(request, name, self.get_response)
+
+    async def __acall__(self, request):
+        name = None
+        if self.may_profile(request):
+            # Checking for a staff user can load the session and user
+            name = await sync_to_async(self.profiled_view)(request)
+        if name is None:
+            return await self.get_response(request)
+        # cProfile and the query log only see the thread they run in. Running
+        # the request from the request's thread means the sync views and ORM
+        # calls beneath, which Django sends to that same thread, are recorded;
+        # time an async view spends on the event loop is not.
+        return await sync_to_async(self.profile)(
+            request, name, async_to_sync(self.get_response)
+        )
+
+    def may_profile(self, request):
+        return settings.PROFILING_ENABLED or request.headers.get(
+            settings.PROFILING_HEADER
+        )
+
+    def profiled_view(self, request):
+        """The view name if this request is to be profiled, else None"""
+        name = view_name(request)
+        sampled = settings.PROFILING_ENABLED and random.random() < sample_rate(name)
+        return name if sampled or is_requested(request) else None
+
+    def profile(self, request, name, get_response):
+        log = QueryLog()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        with profile_connections(log):
+            profile.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profile.disable()
+        duration = (time.perf_counter() - started) * 1000
+
+        try:
+            save_sample(
+                profile,
+                {
+                    'timestamp': timezone.now().isoformat(),
+                    'view': name,
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'ms': round(duration, 3),
+                    'queries': log.queries,
+                },
+            )
+        except OSError:
+            logger.exception('Could not save profile of %s', request.path)
+        return response
@@ -0,0 +1,105 @@
+"""
+Sampled request profiling.
+
+core.middleware.ProfilingMiddleware profiles a sample of requests with
+cProfile and records every SQL query they run, without needing DEBUG. A
+request is sampled when
+
+- PROFILING_ENABLED is on and a random draw falls under the rate for its
+  view in PROFILING_VIEWS (keyed by URL name), else PROFILING_SAMPLE_RATE, or
+- a staff user sends the PROFILING_HEADER header, even with sampling off.
+
+Each sample is written to PROFILING_DIR as a pstats dump (``.prof``) with a
+JSON sidecar holding the view, timing and query log. Only the newest
+PROFILING_MAX_SAMPLES samples are kept. ``manage.py aggregate_profiles``
+summarizes them per view.
+"""
+import json
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+# Collapses the placeholder lists of IN (...) clauses when grouping queries
+PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+class QueryLog:
+    """execute_wrapper that records each query's SQL and duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    'sql': sql,
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                }
+            )
+
+
+def profile_connections(log):
+    """Context manager recording the queries of every database connection"""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(log))
+    return stack
+
+
+def view_name(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    return match.view_name or match._func_path
+
+
+def sample_rate(name):
+    return settings.PROFILING_VIEWS.get(name, settings.PROFILING_SAMPLE_RATE)
+
+
+def is_requested(request):
+    """Whether a staff user asked for this request to be profiled"""
+    if not request.headers.get(settings.PROFILING_HEADER):
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+def save_sample(profile, metadata):
+    """Write one sample and drop the oldest beyond PROFILING_MAX_SAMPLES"""
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    profile.dump_stats(directory / f'{stem}.prof')
+    (directory / f'{stem}.json').write_text(json.dumps(metadata))
+
+    samples = sorted(directory.glob('*.json'))
+    for old in samples[: max(len(samples) - settings.PROFILING_MAX_SAMPLES, 0)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def load_samples(directory, since=None):
+    """Yield (metadata, .prof path) for each sample, oldest first"""
+    for path in sorted(Path(directory).glob('*.json')):
+        metadata = json.loads(path.read_text())
+        if since and metadata['timestamp'] < since.isoformat():
+            continue
+        prof = path.with_suffix('.prof')
+        if prof.exists():
+            yield metadata, prof
+
+
+def normalize_sql(sql):
+    return PLACEHOLDER_LIST.sub('%s, ...', ' '.join(sql.split()))
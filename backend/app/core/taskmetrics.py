@@ -0,0 +1,237 @@
+"""
+Celery task instrumentation.
+
+Signal handlers record, per task name, how long tasks waited in their queue
+before a worker picked them up, how long they ran, and how many succeeded,
+failed or were retried. Publishers stamp each message with its publish time;
+the wait runs from then, or from the ETA of delayed and retried tasks.
+
+Timings are kept as histograms in Redis hashes so every worker process
+contributes to the same totals. Without Redis (development) they are kept in
+the process that recorded them. ``/metrics`` exports them in the Prometheus
+text format together with the current queue depths, and
+``manage.py task_stats`` prints the same data for people.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .cache import get_redis_client, make_key
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, float('inf'))
+OUTCOMES = {'SUCCESS': 'succeeded', 'FAILURE': 'failed', 'RETRY': 'retried'}
+TASKS_KEY = 'taskmetrics:tasks'
+
+_local = defaultdict(lambda: defaultdict(float))
+_local_lock = threading.Lock()
+_started = {}
+
+
+def _task_key(name):
+    return f'taskmetrics:task:{name}'
+
+
+def _bucket(seconds):
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return bound
+    return BUCKETS[-1]
+
+
+def _observations(metric, seconds):
+    return {
+        f'{metric}_count': 1,
+        f'{metric}_sum': seconds,
+        f'{metric}_le_{_bucket(seconds)}': 1,
+    }
+
+
+def record(name, fields):
+    """Add the given amounts to a task's counters"""
+    client = get_redis_client()
+    if client is None:
+        with _local_lock:
+            for field, amount in fields.items():
+                _local[name][field] += amount
+        return
+    pipe = client.pipeline(transaction=False)
+    pipe.sadd(make_key(TASKS_KEY), name)
+    for field, amount in fields.items():
+        pipe.hincrbyfloat(make_key(_task_key(name)), field, amount)
+    pipe.execute()
+
+
+def snapshot():
+    """Return {task name: {field: value}} for every task seen so far"""
+    client = get_redis_client(write=False)
+    if client is None:
+        with _local_lock:
+            return {name: dict(fields) for name, fields in _local.items()}
+    names = sorted(name.decode() for name in client.smembers(make_key(TASKS_KEY)))
+    pipe = client.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(make_key(_task_key(name)))
+    return {
+        name: {field.decode(): float(value) for field, value in fields.items()}
+        for name, fields in zip(names, pipe.execute())
+    }
+
+
+def reset():
+    client = get_redis_client()
+    if client is None:
+        with _local_lock:
+            _local.clear()
+        return
+    names = [name.decode() for name in client.smembers(make_key(TASKS_KEY))]
+    client.delete(make_key(TASKS_KEY), *[make_key(_task_key(name)) for name in names])
+
+
+def histogram(fields, metric):
+    """Cumulative (bound, count) pairs of a task's histogram"""
+    total, pairs = 0, []
+    for bound in BUCKETS:
+        total += fields.get(f'{metric}_le_{bound}', 0)
+        pairs.append((bound, int(total)))
+    return pairs
+
+
+def quantile(fields, metric, q):
+    """Upper bucket bound that the q-quantile falls under, or None"""
+    count = fields.get(f'{metric}_count', 0)
+    for bound, seen in histogram(fields, metric):
+        if count and seen >= q * count:
+            return bound
+    return None
+
+
+def summarize(fields):
+    def mean(metric):
+        count = fields.get(f'{metric}_count', 0)
+        return fields.get(f'{metric}_sum', 0) / count if count else None
+
+    return {
+        'runs': int(fields.get('runtime_count', 0)),
+        'succeeded': int(fields.get('succeeded', 0)),
+        'failed': int(fields.get('failed', 0)),
+        'retried': int(fields.get('retried', 0)),
+        'mean_runtime': mean('runtime'),
+        'p95_runtime': quantile(fields, 'runtime', 0.95),
+        'mean_wait': mean('wait'),
+        'p95_wait': quantile(fields, 'wait', 0.95),
+    }
+
+
+def queue_depths():
+    """Number of messages waiting in each configured queue"""
+    from config.celery import app
+
+    depths = {}
+    with app.connection_for_read() as connection:
+        for queue in settings.CELERY_TASK_QUEUES:
+            with connection.channel() as channel:
+                try:
+                    declared = queue.bind(channel).queue_declare(passive=True)
+                except connection.channel_errors:
+                    depths[queue.name] = 0  # never declared, so empty
+                else:
+                    depths[queue.name] = declared.message_count
+    return depths
+
+
+def _quote(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus(metrics, depths):
+    """Render the counters and queue depths in the Prometheus text format"""
+    lines = []
+
+    def family(name, kind, help):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('celery_queue_length', 'gauge', 'Messages waiting in the queue')
+    for queue, depth in depths.items():
+        lines.append(f'celery_queue_length{{queue="{_quote(queue)}"}} {depth}')
+
+    for outcome in OUTCOMES.values():
+        family(f'celery_task_{outcome}_total', 'counter', f'Task runs that {outcome}')
+        for name, fields in metrics.items():
+            value = int(fields.get(outcome, 0))
+            lines.append(f'celery_task_{outcome}_total{{task="{_quote(name)}"}} {value}')
+
+    for metric, help in (
+        ('runtime', 'Time tasks spent running'),
+        ('wait', 'Time tasks waited in the queue before starting'),
+    ):
+        family(f'celery_task_{metric}_seconds', 'histogram', help)
+        for name, fields in metrics.items():
+            label = f'task="{_quote(name)}"'
+            for bound, count in histogram(fields, metric):
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(
+                    f'celery_task_{metric}_seconds_bucket{{{label},le="{le}"}} {count}'
+                )
+            total = fields.get(f'{metric}_sum', 0)
+            count = int(fields.get(f'{metric}_count', 0))
+            lines.append(f'celery_task_{metric}_seconds_sum{{{label}}} {total}')
+            lines.append(f'celery_task_{metric}_seconds_count{{{label}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _safely(handler):
+    """Metrics must never break publishing or running a task"""
+
+    def wrapper(*args, **kwargs):
+        try:
+            handler(*args, **kwargs)
+        except Exception:
+            logger.exception('Could not record task metrics')
+
+    return wrapper
+
+
+@_safely
+def stamp_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@_safely
+def record_wait(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    published = getattr(task.request, 'published_at', None)
+    if published is None:
+        return
+    ready = float(published)
+    eta = task.request.eta and parse_datetime(str(task.request.eta))
+    if eta:
+        ready = max(ready, eta.timestamp())
+    record(task.name, _observations('wait', max(time.time() - ready, 0.0)))
+
+
+@_safely
+def record_run(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    fields = {}
+    if started is not None:
+        fields.update(_observations('runtime', time.perf_counter() - started))
+    if state in OUTCOMES:
+        fields[OUTCOMES[state]] = 1
+    if fields:
+        record(task.name, fields)
+
+
+def connect():
+    before_task_publish.connect(stamp_publish_time, dispatch_uid='taskmetrics_publish')
+    task_prerun.connect(record_wait, dispatch_uid='taskmetrics_prerun')
+    task_postrun.connect(record_run, dispatch_uid='taskmetrics_postrun')
@@ -0,0 +1,90 @@
+import asyncio
+import hmac
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    JsonResponse,
+)
+from django.utils.cache import add_never_cache_headers
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from . import taskmetrics
+from .health import check_broker, check_cache, check_database
+
+
+def _report(checks):
+    healthy = all(check['ok'] for check in checks.values())
+    return JsonResponse(
+        {'status': 'ok' if healthy else 'unavailable', 'checks': checks},
+        status=200 if healthy else 503,
+    )
+
+
+def probe(view):
+    """require_safe and never_cache for async views, which Django 4.2's do not wrap"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        response = await view(request, *args, **kwargs)
+        add_never_cache_headers(response)
+        return response
+
+    return wrapper
+
+
+@probe
+async def healthz(request):
+    """
+    Liveness: the worker can serve requests
+
+    Dependencies are left to readyz. An outage of the database or PgBouncer
+    would otherwise fail every container's liveness probe and get healthy
+    workers restarted for nothing.
+    """
+    return _report({})
+
+
+@probe
+async def readyz(request):
+    """Readiness: the database, cache and Celery broker all answer"""
+    # The checks run side by side; only the database needs the request's thread
+    database, cache, broker = await asyncio.gather(
+        sync_to_async(check_database)(),
+        sync_to_async(check_cache, thread_sensitive=False)(),
+        sync_to_async(check_broker, thread_sensitive=False)(),
+    )
+    return _report({'database': database, 'cache': cache, 'broker': broker})
+
+
+def _may_scrape(request):
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        given = request.headers.get('Authorization', '')
+        if hmac.compare_digest(given.encode(), expected.encode()):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+@never_cache
+@require_safe
+def metrics(request):
+    """Celery queue depths and task timings in the Prometheus text format"""
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    try:
+        depths = taskmetrics.queue_depths()
+    except Exception:
+        depths = {}  # the task counters are still worth scraping
+    return HttpResponse(
+        taskmetrics.render_prometheus(taskmetrics.snapshot(), depths),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
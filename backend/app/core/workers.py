@@ -0,0 +1,16 @@
+"""
+Gunicorn worker for the ASGI serving mode, see gunicorn.conf.py.
+"""
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """Uvicorn worker that admits at most worker_connections requests at once"""
+
+    # Django 4.2 does not implement the ASGI lifespan protocol
+    CONFIG_KWARGS = {'loop': 'auto', 'http': 'auto', 'lifespan': 'off'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Requests beyond the limit are answered with 503 straight away
+        self.config.limit_concurrency = self.cfg.worker_connections
@@ -0,0 +1,37 @@
+# Gunicorn reads this file from the working directory on startup
+import os
+
+# SERVER_MODE=wsgi runs sync workers, each serving one request at a time.
+# SERVER_MODE=asgi runs uvicorn workers, each serving many requests at once on
+# an event loop; views awaiting slow I/O (SMTP, the database) then hold no
+# worker, and sync views run in a thread per request.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'core.workers.UvicornWorker'
+    # Concurrent requests per worker. Each one running sync code holds its own
+    # database connection, so workers x this stays below PgBouncer's
+    # MAX_CLIENT_CONN (200) with room for the Celery workers.
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 40))
+else:
+    wsgi_app = 'config.wsgi:application'
+
+
+def post_worker_init(worker):
+    """Open the database connection and touch the cache before taking traffic"""
+    if SERVER_MODE == 'asgi':
+        # Requests run in threads of their own, each opening its own database
+        # connection, so one opened here would only sit idle in PgBouncer
+        return
+
+    from core.health import warm_up
+
+    for name, result in warm_up().items():
+        if result['ok']:
+            worker.log.info('Warm-up: %s ready in %sms', name, result['ms'])
+        else:
+            worker.log.warning('Warm-up: %s unavailable: %s', name, result['error'])
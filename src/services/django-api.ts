@@ -10,6 +10,7 @@ import {
   TimeEntry, 
   ScheduledEvent, 
   TimeOffRequest,
+  DashboardBootstrap,
   ApiResponse,
   ApiError 
 } from '@/types/django';
@@ -105,6 +106,12 @@ class DjangoApiService {
     return this.request<DjangoUser>('/auth/user/');
   }
 
+  // Everything the landing view needs in a single request
+  async getBootstrap(sections?: string[]): Promise<DashboardBootstrap> {
+    const query = sections?.length ? `?sections=${sections.join(',')}` : '';
+    return this.request<DashboardBootstrap>(`/dashboard/bootstrap/${query}`);
+  }
+
   // Health check to test connectivity
   async healthCheck(): Promise<{ status: string }> {
     return this.request<{ status: string }>('/health/');
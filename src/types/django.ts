@@ -136,6 +136,23 @@ export interface TimeOffRequest {
   updated_at: string;
 }
 
+// Dashboard bootstrap payload (GET /api/dashboard/bootstrap/)
+export interface DashboardBootstrap {
+  user: DjangoUser;
+  profiles: Profile[];
+  locations: Location[];
+  facilities: Facility[];
+  shifts: Shift[];
+  incident_types: IncidentType[];
+  incident_tickets: IncidentTicket[];
+  scheduled_events: ScheduledEvent[];
+  time_off_requests: TimeOffRequest[];
+  counters: {
+    facilities: { facility_id: number; open_incidents: number; open_services: number }[];
+    user: { assigned_incidents: number; assigned_services: number };
+  };
+}
+
 // API Response types
 export interface ApiResponse<T> {
   results?: T[];